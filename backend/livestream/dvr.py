@@ -0,0 +1,328 @@
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+# Each record in a segment file is: capture timestamp (float64), JPEG length (uint32), JPEG bytes
+RECORD_HEADER = struct.Struct(">dI")
+OPEN_SUFFIX = ".open"
+SEGMENT_SUFFIX = ".seg"
+
+
+class SegmentRing:
+    """
+    Rolling, size-capped ring of on-disk segments for a single camera.
+
+    Frames are appended to an open segment file; once it spans
+    `segment_seconds` it is closed and renamed to `<start_ms>-<end_ms>.seg`
+    so clip lookups only need the directory listing. The oldest closed
+    segments are deleted whenever the ring grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: Path, segment_seconds: float, max_bytes: int):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._file = None
+        self._open_path: Optional[Path] = None
+        self._start_ts = 0.0
+        self._last_ts = 0.0
+        self._closed_bytes = sum(p.stat().st_size for p in self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+        # Segments left open by a previous run are still readable, just finalize them
+        for stale in self.directory.glob(f"*{OPEN_SUFFIX}"):
+            self._finalize(stale)
+
+    def append(self, timestamp: float, jpeg_bytes: bytes):
+        if self._file is None:
+            self._open(timestamp)
+        elif timestamp - self._start_ts >= self.segment_seconds:
+            self._close()
+            self._open(timestamp)
+
+        self._file.write(RECORD_HEADER.pack(timestamp, len(jpeg_bytes)))
+        self._file.write(jpeg_bytes)
+        self._last_ts = timestamp
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._close()
+
+    def _open(self, timestamp: float):
+        self._start_ts = timestamp
+        self._last_ts = timestamp
+        self._open_path = self.directory / f"{int(timestamp * 1000)}{OPEN_SUFFIX}"
+        self._file = self._open_path.open("ab")
+
+    def _close(self):
+        self._file.close()
+        self._file = None
+        self._finalize(self._open_path)
+        self._open_path = None
+        self._evict()
+
+    def _finalize(self, path: Path):
+        records = list(_read_records(path, 0, float("inf")))
+        if not records:
+            path.unlink(missing_ok=True)
+            return
+        start_ms = int(records[0][0] * 1000)
+        end_ms = int(records[-1][0] * 1000)
+        final_path = self.directory / f"{start_ms}-{end_ms}{SEGMENT_SUFFIX}"
+        path.rename(final_path)
+        self._closed_bytes += final_path.stat().st_size
+
+    def _evict(self):
+        if self._closed_bytes <= self.max_bytes:
+            return
+        for segment in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"), key=_segment_start):
+            if self._closed_bytes <= self.max_bytes:
+                break
+            size = segment.stat().st_size
+            segment.unlink(missing_ok=True)
+            self._closed_bytes -= size
+
+    def segments(self) -> List[dict]:
+        """Closed segments plus the one currently being written, oldest first."""
+        result = []
+        for segment in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"), key=_segment_start):
+            start_ms, end_ms = segment.stem.split("-")
+            result.append({
+                "start": int(start_ms) / 1000.0,
+                "end": int(end_ms) / 1000.0,
+                "bytes": segment.stat().st_size,
+                "path": segment,
+            })
+        if self._open_path is not None and self._open_path.exists():
+            result.append({
+                "start": self._start_ts,
+                "end": self._last_ts,
+                "bytes": self._open_path.stat().st_size,
+                "path": self._open_path,
+            })
+        return result
+
+
+class DVR:
+    """
+    Keeps a SegmentRing per camera, fed from the JPEG frames the hub already
+    receives. Disk writes happen on a single background thread so the
+    websocket handlers never block on I/O.
+    """
+
+    def __init__(self, root: str, segment_seconds: float = 10.0, max_bytes_per_camera: int = 500 * 1024 * 1024,
+                 preset: str = "veryfast"):
+        self.root = Path(root)
+        self.segment_seconds = segment_seconds
+        self.max_bytes_per_camera = max_bytes_per_camera
+        self.preset = preset
+        self.ffmpeg = shutil.which("ffmpeg")
+        if not self.ffmpeg:
+            print("Warning: ffmpeg not found on PATH. DVR clips are exported as mp4v, which browsers cannot play.")
+        self.rings: Dict[str, SegmentRing] = {}
+        self.ring_lock = threading.Lock()
+
+        self.queue: "queue.Queue" = queue.Queue(maxsize=1000)
+        self.dropped = 0
+        self.writer_thread = threading.Thread(target=self._writer, daemon=True)
+        self.writer_thread.start()
+
+    def _ring(self, camera_id: str, create: bool = True) -> Optional[SegmentRing]:
+        """
+        The camera's ring. Without `create`, None for a camera that has never been
+        recorded (neither in this run nor in an earlier one), so lookups from clients
+        do not leave directories behind.
+        """
+        directory = self.root / safe_name(camera_id)
+        with self.ring_lock:
+            ring = self.rings.get(camera_id)
+            if ring is None:
+                if not create and not directory.is_dir():
+                    return None
+                ring = SegmentRing(directory, self.segment_seconds, self.max_bytes_per_camera)
+                self.rings[camera_id] = ring
+            return ring
+
+    def record(self, camera_id: str, jpeg_bytes: bytes, timestamp: Optional[float] = None):
+        """Queue a frame for recording. Drops the frame if the writer is behind."""
+        try:
+            self.queue.put_nowait((camera_id, timestamp or time.time(), jpeg_bytes))
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer(self):
+        while True:
+            camera_id, timestamp, jpeg_bytes = self.queue.get()
+            try:
+                ring = self._ring(camera_id)
+                with self.ring_lock:
+                    ring.append(timestamp, jpeg_bytes)
+                    if self.queue.empty():
+                        ring.flush()
+            except Exception as e:
+                print(f"DVR write error for {camera_id}: {e}")
+
+    def close(self, camera_id: str):
+        """Finalize the open segment of a camera (e.g. when it disconnects)."""
+        with self.ring_lock:
+            ring = self.rings.get(camera_id)
+            if ring:
+                ring.close()
+
+    def segments(self, camera_id: str) -> Optional[List[dict]]:
+        """The camera's segments, oldest first, or None if it has never been recorded."""
+        ring = self._ring(camera_id, create=False)
+        if ring is None:
+            return None
+        with self.ring_lock:
+            ring.flush()
+            return ring.segments()
+
+    def frames(self, camera_id: str, start: float, end: float, with_data: bool = True):
+        """Yields (timestamp, jpeg_bytes) for every recorded frame in [start, end]; jpeg_bytes is None without `with_data`."""
+        for segment in self.segments(camera_id) or []:
+            if segment["end"] < start or segment["start"] > end:
+                continue
+            yield from _read_records(segment["path"], start, end, with_data)
+
+    def export_clip(self, camera_id: str, start: float, end: float) -> Optional[str]:
+        """
+        Encodes the frames in [start, end] into an mp4 file and returns its path,
+        or None if nothing was recorded in that range. Caller owns the file.
+
+        Two passes over the segments: the first only reads timestamps, for the
+        frame rate, the second streams the JPEGs into the encoder, so a long clip
+        is never held in memory. With ffmpeg the clip is H.264 (yuv420p,
+        faststart) for browsers; without it, OpenCV's mp4v.
+        """
+        count = 0
+        first = last = None
+        for timestamp, _ in self.frames(camera_id, start, end, with_data=False):
+            first = timestamp if first is None else first
+            last = timestamp
+            count += 1
+        if not count:
+            return None
+        fps = (count - 1) / (last - first) if last > first else 1.0
+        fps = min(max(fps, 1.0), 60.0)
+
+        fd, clip_path = tempfile.mkstemp(suffix=".mp4", prefix=f"{safe_name(camera_id)}_")
+        os.close(fd)
+        try:
+            encode = self._encode_ffmpeg if self.ffmpeg else self._encode_opencv
+            written = encode(self.frames(camera_id, start, end), fps, clip_path)
+        except Exception:
+            os.remove(clip_path)
+            raise
+        if not written:
+            os.remove(clip_path)
+            return None
+        return clip_path
+
+    def _encode_ffmpeg(self, frames, fps: float, clip_path: str) -> bool:
+        process = None
+        # A file rather than a pipe: ffmpeg may complain about every broken frame of a long clip
+        errors = tempfile.TemporaryFile()
+        try:
+            for _, jpeg_bytes in frames:
+                if process is None:
+                    # The first frame that decodes fixes the size; later frames of another size are scaled to it
+                    frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+                    if frame is None:
+                        continue
+                    height, width = frame.shape[:2]
+                    process = subprocess.Popen([
+                        self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+                        "-f", "image2pipe", "-c:v", "mjpeg", "-framerate", f"{fps:.3f}", "-i", "-",
+                        "-an", "-vf", f"scale={width // 2 * 2}:{height // 2 * 2},setsar=1",
+                        "-c:v", "libx264", "-preset", self.preset, "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+                        clip_path,
+                    ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors)
+                process.stdin.write(jpeg_bytes)
+        except BrokenPipeError:
+            pass
+        finally:
+            if process is not None:
+                process.stdin.close()
+                process.wait()
+            errors.seek(0)
+            error = errors.read().decode(errors="replace").strip()
+            errors.close()
+        if process is None:
+            return False
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode the clip: {error[-500:]}")
+        return True
+
+    def _encode_opencv(self, frames, fps: float, clip_path: str) -> bool:
+        writer = None
+        try:
+            for _, jpeg_bytes in frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+                elif frame.shape[:2] != (height, width):
+                    frame = cv2.resize(frame, (width, height))
+                writer.write(frame)
+        finally:
+            if writer is not None:
+                writer.release()
+        return writer is not None
+
+    def purge(self, camera_id: str):
+        with self.ring_lock:
+            ring = self.rings.pop(camera_id, None)
+            if ring:
+                ring.close()
+        shutil.rmtree(self.root / safe_name(camera_id), ignore_errors=True)
+
+
+def _read_records(path: Path, start: float, end: float, with_data: bool = True):
+    try:
+        with path.open("rb") as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                timestamp, length = RECORD_HEADER.unpack(header)
+                if timestamp > end:
+                    return
+                if timestamp < start or not with_data:
+                    f.seek(length, os.SEEK_CUR)
+                    if timestamp >= start:
+                        yield timestamp, None
+                    continue
+                data = f.read(length)
+                if len(data) < length:
+                    # Truncated tail of a segment that was still being written
+                    return
+                yield timestamp, data
+    except FileNotFoundError:
+        # Segment evicted while we were reading
+        return
+
+
+def _segment_start(path: Path) -> int:
+    return int(path.stem.split("-")[0])
+
+
+def safe_name(camera_id: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in camera_id)
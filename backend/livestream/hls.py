@@ -0,0 +1,177 @@
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from dvr import safe_name
+
+PLAYLIST_NAME = "index.m3u8"
+
+
+class CameraEncoder:
+    """
+    One ffmpeg process per camera turning the pushed JPEG frames into H.264
+    fragmented-MP4 HLS segments. Frames are fed from a bounded queue on a
+    dedicated thread; if the encoder falls behind, new frames are dropped
+    rather than delaying the ingest websocket.
+
+    Every (re)start of ffmpeg is a new generation whose init segment and
+    media segments carry the generation in their names, so a restarted
+    encoder (possibly at another resolution) never reuses a URL that
+    players or proxies have cached as immutable.
+    """
+
+    def __init__(self, camera_id: str, directory: Path, ffmpeg: str, preset: str,
+                 fps: int, segment_seconds: float, list_size: int):
+        self.camera_id = camera_id
+        self.directory = directory
+        self.ffmpeg = ffmpeg
+        self.preset = preset
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.list_size = list_size
+
+        self.queue: "queue.Queue" = queue.Queue(maxsize=fps * 2)
+        self.dropped = 0
+        self.process: Optional[subprocess.Popen] = None
+        self.generation = ""
+        self.running = True
+        self.thread = threading.Thread(target=self._feed, daemon=True)
+        self.thread.start()
+
+    def _command(self):
+        gop = max(1, int(self.fps * self.segment_seconds))
+        return [
+            self.ffmpeg, "-hide_banner", "-loglevel", "error",
+            # Start encoding straight away instead of probing the pipe for seconds
+            "-fflags", "nobuffer", "-probesize", "32", "-analyzeduration", "0",
+            "-use_wallclock_as_timestamps", "1",
+            "-f", "image2pipe", "-c:v", "mjpeg", "-i", "-",
+            "-an",
+            "-c:v", "libx264", "-preset", self.preset, "-tune", "zerolatency",
+            "-pix_fmt", "yuv420p", "-r", str(self.fps),
+            "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+            "-force_key_frames", f"expr:gte(t,n_forced*{self.segment_seconds})",
+            "-f", "hls",
+            "-hls_time", str(self.segment_seconds),
+            "-hls_list_size", str(self.list_size),
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", f"init_{self.generation}.mp4",
+            "-hls_flags", "delete_segments+independent_segments+program_date_time",
+            "-hls_segment_filename", str(self.directory / f"seg_{self.generation}_%06d.m4s"),
+            str(self.directory / PLAYLIST_NAME),
+        ]
+
+    def _start(self):
+        # The old encoder must be gone before its files are, or it may write into the new directory
+        self._stop_process()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.generation = format(int(time.time() * 1000), "x")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Unbuffered stdin so each frame reaches the encoder as soon as it is written
+        self.process = subprocess.Popen(self._command(), stdin=subprocess.PIPE, bufsize=0,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _feed(self):
+        while self.running:
+            try:
+                jpeg_bytes = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if jpeg_bytes is None:
+                break
+            try:
+                if self.process is None or self.process.poll() is not None:
+                    if self.process is not None:
+                        print(f"HLS encoder for {self.camera_id} exited ({self.process.returncode}), restarting")
+                    self._start()
+                self.process.stdin.write(jpeg_bytes)
+            except (BrokenPipeError, OSError) as e:
+                print(f"HLS encoder error for {self.camera_id}: {e}")
+                self._stop_process()
+        self._stop_process()
+
+    def push(self, jpeg_bytes: bytes):
+        try:
+            self.queue.put_nowait(jpeg_bytes)
+        except queue.Full:
+            self.dropped += 1
+
+    def _stop_process(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def stop(self):
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            # Feeder is busy; it checks `running` before taking the next frame
+            pass
+
+
+class HLSPackager:
+    """Encodes each camera once and serves the result to any number of viewers as static segments."""
+
+    def __init__(self, root: str, preset: str = "veryfast", fps: int = 15,
+                 segment_seconds: float = 1.0, list_size: int = 6):
+        self.root = Path(root)
+        self.preset = preset
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.list_size = list_size
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.encoders: Dict[str, CameraEncoder] = {}
+        self.lock = threading.Lock()
+
+        if not self.ffmpeg:
+            print("Warning: ffmpeg not found on PATH. HLS output is disabled.")
+
+    @property
+    def available(self) -> bool:
+        return self.ffmpeg is not None
+
+    def push(self, camera_id: str, jpeg_bytes: bytes):
+        if not self.available:
+            return
+        with self.lock:
+            encoder = self.encoders.get(camera_id)
+            if encoder is None:
+                encoder = CameraEncoder(camera_id, self.root / safe_name(camera_id), self.ffmpeg,
+                                        self.preset, self.fps, self.segment_seconds, self.list_size)
+                self.encoders[camera_id] = encoder
+        encoder.push(jpeg_bytes)
+
+    def stop(self, camera_id: str):
+        with self.lock:
+            encoder = self.encoders.pop(camera_id, None)
+        if encoder:
+            encoder.stop()
+
+    def file_path(self, camera_id: str, filename: str) -> Optional[Path]:
+        """Resolves a playlist/segment name for a camera, refusing anything outside its directory."""
+        if "/" in filename or ".." in filename:
+            return None
+        if filename != PLAYLIST_NAME and not (filename.startswith("init_") and filename.endswith(".mp4")) and not (
+                filename.startswith("seg_") and filename.endswith(".m4s")):
+            return None
+        path = self.root / safe_name(camera_id) / filename
+        return path if path.is_file() else None
+
+    def dropped(self) -> Dict[str, int]:
+        with self.lock:
+            return {camera_id: encoder.dropped for camera_id, encoder in self.encoders.items()}
+
@@ -3,13 +3,23 @@ import uvicorn
 import numpy as np
 import json
 from fastapi import FastAPI, Request, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, HTMLResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 import threading
 import time
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import os
+import sys
+
+# Modules shared with the vision model live in the repository's `common` directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from common.shm_ring import FrameRingReader
+from dvr import DVR
+from metrics import HubMetrics
+from hls import HLSPackager, PLAYLIST_NAME
 
 app = FastAPI(title="Live Stream Hub")
 
@@ -23,12 +33,124 @@ app.add_middleware(
 )
 
 # Store the latest frame and metadata for each camera
-# Format: {camera_id: {'image': bytes, 'metadata': dict}}
+# Format: {camera_id: {'image': bytes, 'metadata': dict, 'seq': int}}
+# Cameras ingested over shared memory also carry 'raw' (the BGR frame) and only
+# have 'image' when a consumer (DVR/HLS) needed the JPEG.
 streams: Dict[str, Dict[str, Any]] = {}
 
 # Lock for thread safety
 stream_lock = threading.Lock()
 
+# Rolling on-disk recorder of the pushed frames
+DVR_ENABLED = os.getenv("DVR_ENABLED", "1") == "1"
+DVR_DIR = os.getenv("DVR_DIR", "dvr")
+DVR_SEGMENT_SECONDS = float(os.getenv("DVR_SEGMENT_SECONDS", 10))
+DVR_MAX_MB_PER_CAMERA = int(os.getenv("DVR_MAX_MB_PER_CAMERA", 500))
+DVR_MAX_CLIP_SECONDS = float(os.getenv("DVR_MAX_CLIP_SECONDS", 300))
+
+dvr = DVR(DVR_DIR, DVR_SEGMENT_SECONDS, DVR_MAX_MB_PER_CAMERA * 1024 * 1024) if DVR_ENABLED else None
+
+metrics = HubMetrics()
+
+# Optional H.264 fMP4 HLS output, encoded once per camera and shared by all viewers
+HLS_ENABLED = os.getenv("HLS_ENABLED", "0") == "1"
+HLS_DIR = os.getenv("HLS_DIR", "hls")
+HLS_PRESET = os.getenv("HLS_PRESET", "veryfast")
+HLS_FPS = int(os.getenv("HLS_FPS", 15))
+HLS_SEGMENT_SECONDS = float(os.getenv("HLS_SEGMENT_SECONDS", 1))
+HLS_LIST_SIZE = int(os.getenv("HLS_LIST_SIZE", 6))
+
+hls = HLSPackager(HLS_DIR, HLS_PRESET, HLS_FPS, HLS_SEGMENT_SECONDS, HLS_LIST_SIZE) if HLS_ENABLED else None
+
+# Same-host ingest: these cameras are read from the vision model's shared-memory ring
+# instead of being pushed over the websocket. Leave empty when the model runs elsewhere.
+SHM_INGEST_CAMERAS = [c.strip() for c in os.getenv("SHM_INGEST_CAMERAS", "").split(",") if c.strip()]
+SHM_STALE_SECONDS = float(os.getenv("SHM_STALE_SECONDS", 3))
+# Shared-memory frames are only JPEG-encoded on demand: for the DVR at this lower rate, and
+# for HLS at HLS_FPS while someone fetched the camera's HLS output in the last HLS_IDLE_SECONDS
+DVR_SHM_FPS = float(os.getenv("DVR_SHM_FPS", 5))
+HLS_IDLE_SECONDS = float(os.getenv("HLS_IDLE_SECONDS", 30))
+
+# camera_id -> time of the last HLS request for it, for cameras currently in `streams`
+hls_requested: Dict[str, float] = {}
+
+def drop_stream(camera_id: str):
+    """Forgets a camera's live state once its publisher goes away."""
+    with stream_lock:
+        # Maybe keep last frame for a bit? Or delete immediately?
+        # Deleting for now to avoid stale streams
+        if camera_id in streams:
+            del streams[camera_id]
+        hls_requested.pop(camera_id, None)
+    if dvr:
+        dvr.close(camera_id)
+    if hls:
+        hls.stop(camera_id)
+
+def shm_ingest_worker(camera_id: str):
+    """Polls a camera's shared-memory ring and publishes new frames into `streams`."""
+    reader = None
+    last_dvr = last_hls = 0.0
+    while True:
+        if reader is None:
+            try:
+                reader = FrameRingReader(camera_id)
+            except (FileNotFoundError, ValueError):
+                time.sleep(1)
+                continue
+
+        if time.time() - reader.heartbeat() > SHM_STALE_SECONDS:
+            # Writer stopped publishing; treat it like a websocket disconnect and wait for a new ring
+            reader.close()
+            reader = None
+            with stream_lock:
+                connected = camera_id in streams
+            if connected:
+                print(f"Camera {camera_id} (shared memory) went stale")
+                drop_stream(camera_id)
+            time.sleep(1)
+            continue
+
+        latest = reader.read_latest()
+        if latest is None:
+            time.sleep(0.005)
+            continue
+        _, _, frame, meta = latest
+
+        # Viewers draw on the raw frame themselves; only encode when a recorder is due for a frame
+        now = time.time()
+        with stream_lock:
+            hls_watched = now - hls_requested.get(camera_id, 0.0) < HLS_IDLE_SECONDS
+        want_dvr = dvr is not None and now - last_dvr >= 1 / DVR_SHM_FPS
+        want_hls = hls is not None and hls_watched and now - last_hls >= 1 / HLS_FPS
+        jpeg_bytes = None
+        if want_dvr or want_hls:
+            ret, buffer = cv2.imencode('.jpg', frame)
+            if ret:
+                jpeg_bytes = buffer.tobytes()
+
+        with stream_lock:
+            if camera_id not in streams:
+                print(f"Camera {camera_id} connected via shared memory")
+                streams[camera_id] = {'image': None, 'metadata': {}, 'seq': 0}
+            streams[camera_id]['raw'] = frame
+            streams[camera_id]['image'] = jpeg_bytes
+            streams[camera_id]['seq'] += 1
+            if meta.get("type") == "detections":
+                streams[camera_id]['metadata'] = meta
+        metrics.frame_received(camera_id, frame.nbytes, shared_memory=True)
+
+        if jpeg_bytes:
+            if want_dvr:
+                dvr.record(camera_id, jpeg_bytes)
+                last_dvr = now
+            if want_hls:
+                hls.push(camera_id, jpeg_bytes)
+                last_hls = now
+
+for shm_camera_id in SHM_INGEST_CAMERAS:
+    threading.Thread(target=shm_ingest_worker, args=(shm_camera_id,), daemon=True).start()
+
 @app.websocket("/ws/push/{camera_id}")
 async def websocket_endpoint(websocket: WebSocket, camera_id: str):
     await websocket.accept()
@@ -40,11 +162,17 @@ async def websocket_endpoint(websocket: WebSocket, camera_id: str):
             
             with stream_lock:
                 if camera_id not in streams:
-                    streams[camera_id] = {'image': None, 'metadata': {}}
+                    streams[camera_id] = {'image': None, 'metadata': {}, 'seq': 0}
                 
                 if message["type"] == "websocket.receive":
                     if "bytes" in message and message["bytes"] is not None:
                         streams[camera_id]['image'] = message["bytes"]
+                        streams[camera_id]['seq'] += 1
+                        metrics.frame_received(camera_id, len(message["bytes"]))
+                        if dvr:
+                            dvr.record(camera_id, message["bytes"])
+                        if hls:
+                            hls.push(camera_id, message["bytes"])
                     elif "text" in message and message["text"] is not None:
                          try:
                              meta = json.loads(message["text"])
@@ -57,26 +185,110 @@ async def websocket_endpoint(websocket: WebSocket, camera_id: str):
     except Exception as e:
         print(f"Error in websocket {camera_id}: {e}")
     finally:
-        with stream_lock:
-            # Maybe keep last frame for a bit? Or delete immediately?
-            # Deleting for now to avoid stale streams
-            if camera_id in streams:
-                del streams[camera_id]
+        drop_stream(camera_id)
 
 @app.get("/active_cameras")
 async def get_active_cameras():
     """Returns a list of currently active camera IDs."""
     with stream_lock:
         return {"cameras": list(streams.keys())}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Per-camera ingest rates, viewers, render latency and dropped frames."""
+    snapshot = metrics.snapshot()
+    with stream_lock:
+        for camera_id, camera in snapshot["cameras"].items():
+            camera["active"] = camera_id in streams
+    if dvr:
+        snapshot["dvr_dropped_frames"] = dvr.dropped
+    if hls:
+        snapshot["hls_dropped_frames"] = hls.dropped()
+    return snapshot
     
-def process_frame(jpeg_bytes, metadata, mode):
-    """Draws bounding boxes on frame based on mode."""
-    if not jpeg_bytes:
+@app.get("/dvr/{camera_id}/segments")
+async def get_dvr_segments(camera_id: str):
+    """Lists the recorded segments currently held in the camera's ring."""
+    if not dvr:
+        raise HTTPException(status_code=404, detail="DVR is disabled")
+    segments = await asyncio.to_thread(dvr.segments, camera_id)
+    if segments is None:
+        raise HTTPException(status_code=404, detail="Camera has never been recorded")
+    return {
+        "camera_id": camera_id,
+        "segments": [{"start": s["start"], "end": s["end"], "bytes": s["bytes"]} for s in segments]
+    }
+
+@app.get("/clip/{camera_id}")
+async def get_clip(camera_id: str, start: float, end: Optional[float] = None):
+    """
+    Returns an mp4 clip of the camera between `start` and `end` (unix seconds).
+    `end` defaults to now, so `?start=<t - 30>` gives the last 30 seconds.
+    """
+    if not dvr:
+        raise HTTPException(status_code=404, detail="DVR is disabled")
+    if end is None:
+        end = time.time()
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if end - start > DVR_MAX_CLIP_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Clips are limited to {DVR_MAX_CLIP_SECONDS:.0f} seconds")
+
+    clip_path = await asyncio.to_thread(dvr.export_clip, camera_id, start, end)
+    if not clip_path:
+        raise HTTPException(status_code=404, detail="No recording for that range")
+
+    filename = f"{camera_id}_{int(start)}_{int(end)}.mp4"
+    return FileResponse(clip_path, media_type="video/mp4", filename=filename,
+                        background=BackgroundTask(os.remove, clip_path))
+
+HLS_CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+@app.get("/hls/{camera_id}/{filename}")
+async def get_hls(camera_id: str, filename: str):
+    """
+    Serves the camera's HLS playlist (`index.m3u8`), init segment and media segments.
+    Init and media segment names include the encoder's generation, so a name is never reused
+    after an encoder restart and segments are cacheable by any proxy in front of the hub.
+    """
+    if not hls or not hls.available:
+        raise HTTPException(status_code=404, detail="HLS output is disabled")
+    # Keeps shared-memory cameras feeding the encoder while anyone is watching. Only cameras
+    # being ingested are tracked, and drop_stream forgets them, so unknown ids leave nothing behind.
+    with stream_lock:
+        if camera_id in streams:
+            hls_requested[camera_id] = time.time()
+    path = hls.file_path(camera_id, filename)
+    if not path:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    if filename == PLAYLIST_NAME:
+        cache_control = "no-cache"
+    else:
+        cache_control = f"public, max-age={int(HLS_SEGMENT_SECONDS * HLS_LIST_SIZE * 10)}, immutable"
+    return FileResponse(path, media_type=HLS_CONTENT_TYPES[path.suffix], headers={"Cache-Control": cache_control})
+    
+def process_frame(jpeg_bytes, metadata, mode, timings=None, raw_frame=None):
+    """
+    Draws bounding boxes on frame based on mode.
+    If a `timings` dict is given it is filled with the decode/draw/encode durations in seconds.
+    `raw_frame` (shared-memory ingest) skips the JPEG decode.
+    """
+    if not jpeg_bytes and raw_frame is None:
         return None
 
     # Decode
-    nparr = np.frombuffer(jpeg_bytes, np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    t0 = time.perf_counter()
+    if raw_frame is not None:
+        frame = raw_frame.copy()
+    else:
+        nparr = np.frombuffer(jpeg_bytes, np.uint8)
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    t1 = time.perf_counter()
     
     if frame is None:
         return None
@@ -135,7 +347,12 @@ def process_frame(jpeg_bytes, metadata, mode):
                 cv2.FONT_HERSHEY_SIMPLEX, 1, color, 3)
     
     # Re-encode
+    t2 = time.perf_counter()
     ret, buffer = cv2.imencode('.jpg', frame)
+    if timings is not None:
+        timings["decode"] = t1 - t0
+        timings["draw"] = t2 - t1
+        timings["encode"] = time.perf_counter() - t2
     if ret:
         return buffer.tobytes()
     return None
@@ -144,23 +361,37 @@ def generate_frames(camera_id: str, mode: str = "fight"):
     """
     Generator that yields frames for a specific camera with requested visualization.
     """
-    while True:
-        frame_data = None
-        metadata = {}
-        
-        with stream_lock:
-            data = streams.get(camera_id)
-            if data:
-                frame_data = data.get('image')
-                metadata = data.get('metadata', {})
-        
-        if frame_data:
-            processed_frame = process_frame(frame_data, metadata, mode)
-            if processed_frame:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + processed_frame + b'\r\n')
-        
-        time.sleep(0.033) # 30 FPS
+    metrics.viewer_joined(camera_id, mode)
+    last_seq = None
+    try:
+        while True:
+            frame_data = None
+            raw_frame = None
+            metadata = {}
+            seq = None
+            
+            with stream_lock:
+                data = streams.get(camera_id)
+                if data:
+                    frame_data = data.get('image')
+                    raw_frame = data.get('raw')
+                    metadata = data.get('metadata', {})
+                    seq = data.get('seq')
+            
+            if frame_data or raw_frame is not None:
+                timings = {}
+                processed_frame = process_frame(frame_data, metadata, mode, timings, raw_frame)
+                if processed_frame:
+                    # Frames that arrived since the last one we sent were never seen by this viewer
+                    dropped = max(0, seq - last_seq - 1) if last_seq is not None and seq is not None else 0
+                    last_seq = seq
+                    metrics.frame_sent(camera_id, dropped, timings)
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + processed_frame + b'\r\n')
+            
+            time.sleep(0.033) # 30 FPS
+    finally:
+        metrics.viewer_left(camera_id, mode)
 
 @app.get("/", response_class=HTMLResponse)
 async def index():
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+# Upper bounds in milliseconds; anything slower lands in the overflow bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250)
+RATE_WINDOW_SECONDS = 5.0
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, cheap enough to update on every frame."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000.0
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self) -> dict:
+        labels = [f"<={b}ms" for b in self.buckets] + [f">{self.buckets[-1]}ms"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class CameraMetrics:
+    def __init__(self):
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.shm_bytes_in = 0
+        self.last_frame_at = None
+        # (timestamp, network bytes, shared-memory bytes) of recent frames for the rate estimates
+        self.recent = deque()
+        self.viewers: Dict[str, int] = {}
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.render = {
+            "decode": Histogram(),
+            "draw": Histogram(),
+            "encode": Histogram(),
+        }
+
+    def _trim(self, now: float):
+        while self.recent and now - self.recent[0][0] > RATE_WINDOW_SECONDS:
+            self.recent.popleft()
+
+    def snapshot(self, now: float) -> dict:
+        self._trim(now)
+        window_bytes = sum(size for _, size, _ in self.recent)
+        window_shm_bytes = sum(size for _, _, size in self.recent)
+        return {
+            "ingest_fps": round(len(self.recent) / RATE_WINDOW_SECONDS, 2),
+            "ingest_bytes_per_sec": round(window_bytes / RATE_WINDOW_SECONDS, 1),
+            "frames_in": self.frames_in,
+            "bytes_in": self.bytes_in,
+            # Raw frames read from the vision model's shared memory, kept apart from the JPEG bytes sent over the network
+            "shm_bytes_per_sec": round(window_shm_bytes / RATE_WINDOW_SECONDS, 1),
+            "shm_bytes_in": self.shm_bytes_in,
+            "seconds_since_last_frame": round(now - self.last_frame_at, 3) if self.last_frame_at else None,
+            "viewers": dict(self.viewers),
+            "viewers_total": sum(self.viewers.values()),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "render_latency": {stage: h.snapshot() for stage, h in self.render.items()},
+        }
+
+
+class HubMetrics:
+    """Per-camera counters for the livestream hub, shared by the ingest and viewer paths."""
+
+    def __init__(self):
+        self.cameras: Dict[str, CameraMetrics] = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _camera(self, camera_id: str) -> CameraMetrics:
+        camera = self.cameras.get(camera_id)
+        if camera is None:
+            camera = CameraMetrics()
+            self.cameras[camera_id] = camera
+        return camera
+
+    def frame_received(self, camera_id: str, size: int, shared_memory: bool = False):
+        """Counts an ingested frame; `size` is its bytes over the network, or in shared memory."""
+        now = time.time()
+        with self.lock:
+            camera = self._camera(camera_id)
+            camera.frames_in += 1
+            if shared_memory:
+                camera.shm_bytes_in += size
+                camera.recent.append((now, 0, size))
+            else:
+                camera.bytes_in += size
+                camera.recent.append((now, size, 0))
+            camera.last_frame_at = now
+            camera._trim(now)
+
+    def viewer_joined(self, camera_id: str, mode: str):
+        with self.lock:
+            viewers = self._camera(camera_id).viewers
+            viewers[mode] = viewers.get(mode, 0) + 1
+
+    def viewer_left(self, camera_id: str, mode: str):
+        with self.lock:
+            viewers = self._camera(camera_id).viewers
+            viewers[mode] = max(0, viewers.get(mode, 0) - 1)
+
+    def frame_sent(self, camera_id: str, dropped: int, timings: dict):
+        with self.lock:
+            camera = self._camera(camera_id)
+            camera.frames_sent += 1
+            camera.frames_dropped += dropped
+            for stage, seconds in timings.items():
+                camera.render[stage].observe(seconds)
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self.lock:
+            return {
+                "uptime_seconds": round(now - self.started_at, 1),
+                "cameras": {camera_id: camera.snapshot(now) for camera_id, camera in self.cameras.items()},
+            }
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import re
+import uuid
+
+from starlette.staticfiles import StaticFiles
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ClipStore:
+    """
+    Content-addressed clip files.
+
+    Every clip is stored once, as `<directory>/<sha256><ext>`, however many
+    sessions reference it. Uploads are first streamed to a temporary file in
+    `temp_dir` (on the same filesystem, so the final rename is atomic) and
+    only moved into place if no clip with that hash exists yet; otherwise the
+    temporary copy is simply dropped. Which sessions use a clip is tracked in
+    the `clips` table (schema v5).
+    """
+
+    def __init__(self, directory: str, temp_dir: str):
+        self.directory = directory
+        self.temp_dir = temp_dir
+        os.makedirs(directory, exist_ok=True)
+        os.makedirs(temp_dir, exist_ok=True)
+
+    def path_for(self, sha256: str, ext: str = ".mp4") -> str:
+        if not SHA256_RE.match(sha256):
+            raise ValueError(f"Invalid clip hash: {sha256!r}")
+        return os.path.join(self.directory, f"{sha256}{ext.lower()}")
+
+    def temp_path(self) -> str:
+        return os.path.join(self.temp_dir, f"{uuid.uuid4().hex}.tmp")
+
+    def _adopt(self, temp_path: str, final_path: str) -> bool:
+        if os.path.exists(final_path):
+            os.remove(temp_path)
+            return False
+        os.replace(temp_path, final_path)
+        return True
+
+    async def adopt(self, temp_path: str, sha256: str, ext: str) -> tuple:
+        """
+        Moves a fully written temporary file into the store under its hash.
+        Returns (path, stored); `stored` is False when the clip was already there.
+        """
+        final_path = self.path_for(sha256, ext)
+        return final_path, await asyncio.to_thread(self._adopt, temp_path, final_path)
+
+
+def clip_extension(filename) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    # Anything odd in the client's filename falls back to the extension the vision model writes
+    return ext if re.match(r"^\.[a-z0-9]{1,5}$", ext) else ".mp4"
+
+
+class ClipFiles(StaticFiles):
+    """
+    The /videos mount. Starlette answers Range requests (206) itself, so players can seek and
+    start without downloading the whole clip; hash-named files never change and may be cached forever.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        stem = os.path.splitext(os.path.basename(full_path))[0]
+        if SHA256_RE.match(stem):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
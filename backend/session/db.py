@@ -0,0 +1,72 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Database:
+    """
+    SQLite access layer for the session service.
+
+    The database runs in WAL mode so readers never wait for the writer. Reads
+    run on a small pool of threads that each keep their own connection; all
+    writes go through a single dedicated writer thread, since SQLite only
+    allows one writer at a time anyway. Every connection keeps a statement
+    cache, so the handlers' fixed queries are only prepared once.
+
+    Handlers pass a plain function taking a connection:
+
+        row = await db.read(lambda conn: conn.execute(...).fetchone())
+    """
+
+    def __init__(self, path: str, readers: int = 4, cached_statements: int = 256, busy_timeout: float = 5.0):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens a new connection with the service's pragmas. Mostly for startup and scripts."""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL is durable across application crashes, only a power loss can drop the last commits
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            self._local.conn = conn
+        return conn
+
+    def _run_read(self, fn, args):
+        return fn(self._connection(), *args)
+
+    def _run_write(self, fn, args):
+        conn = self._connection()
+        with conn:
+            return fn(conn, *args)
+
+    async def read(self, fn, *args):
+        """Runs `fn(conn, *args)` on a reader thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, fn, args)
+
+    async def write(self, fn, *args):
+        """Runs `fn(conn, *args)` in a transaction on the writer thread. Rolls back if it raises."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._run_write, fn, args)
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,43 @@
+import asyncio
+import json
+from typing import Optional, Set
+
+
+class ChangeFeed:
+    """
+    In-memory fan-out of session change events to server-sent-event subscribers.
+
+    Event ids are session revisions (see schema v3), so they only ever grow
+    and a reconnecting client can resume from its `Last-Event-ID` by reading
+    `rev > id` from the database. Subscribers that stop reading are cut off
+    instead of letting their queue grow; they resume the same way.
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    def publish(self, event_type: str, session: dict):
+        event = (session["rev"], event_type, session)
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.subscribers.discard(queue)
+                # Replace the backlog with an end-of-stream marker
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+
+def format_event(event_id: Optional[int], event_type: str, data) -> str:
+    lines = f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+    return f"id: {event_id}\n{lines}" if event_id is not None else lines
@@ -0,0 +1,32 @@
+import math
+from typing import Tuple
+
+EARTH_RADIUS_M = 6371008.8
+# Half the Earth's circumference: no two points are further apart
+MAX_DISTANCE_M = math.pi * EARTH_RADIUS_M
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lon: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """
+    (south, west, north, east) of a box containing every point within
+    `radius_m` of (lat, lon). Boxes reaching a pole or across the
+    antimeridian are widened to all longitudes rather than split.
+    """
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    south, north = lat - dlat, lat + dlat
+    if south <= -90 or north >= 90:
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+    dlon = math.degrees(radius_m / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+    west, east = lon - dlon, lon + dlon
+    if west < -180 or east > 180:
+        return south, -180.0, north, 180.0
+    return south, west, north, east
@@ -0,0 +1,447 @@
+import asyncio
+import calendar
+import json
+import os
+import time
+import uuid
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from db import Database
+from schema import SEVERITY_RANK, parse_confidence, parse_coordinate
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Session columns an Incident is loaded from
+INCIDENT_COLUMNS = ("session_id, camera_id, event_type, created_at, status, video_path, description, verdict, severity, "
+                    "confidence, confidence_label, latitude, longitude")
+
+
+def to_timestamp(epoch: float) -> str:
+    """Same UTC format as SQLite's CURRENT_TIMESTAMP."""
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(epoch))
+
+
+def from_timestamp(value: str) -> float:
+    return calendar.timegm(time.strptime(value[:19], TIMESTAMP_FORMAT))
+
+
+class Incident:
+    """One session being built up from repeated events of the same type on the same camera."""
+
+    def __init__(self, session_id: str, camera_id: str, event_type: str, created_at: float,
+                 status: str = "pending", persisted: bool = False):
+        self.session_id = session_id
+        self.camera_id = camera_id
+        self.event_type = event_type
+        self.created_at = created_at
+        self.status = status
+        # False until the session row has been written by a flush
+        self.persisted = persisted
+        self.video_path = None
+        self.description = None
+        self.verdict = None
+        self.severity = None
+        self.confidence = None
+        self.confidence_label = None
+        self.latitude = None
+        self.longitude = None
+        self.recipients = set()
+        self.clips: List[dict] = []
+        self.pending_clips: List[dict] = []
+        self.dirty = False
+
+    @classmethod
+    def from_row(cls, row) -> "Incident":
+        incident = cls(row["session_id"], row["camera_id"], row["event_type"], from_timestamp(row["created_at"]),
+                       row["status"], persisted=True)
+        for field in ("video_path", "description", "verdict", "severity", "confidence", "confidence_label",
+                      "latitude", "longitude"):
+            setattr(incident, field, row[field])
+        return incident
+
+    def apply(self, event: dict):
+        """Merges an event: latest clip, description and verdict, peak severity and confidence."""
+        clip = {"video_path": event["video_path"], "sha256": event["sha256"], "size": event["size"], "ts": event["ts"]}
+        self.clips.append(clip)
+        self.pending_clips.append(clip)
+        self.video_path = event["video_path"]
+        self.description = event["description"]
+        # Events journaled before verdicts were recorded have none
+        self.verdict = event.get("verdict") or self.verdict
+        self.recipients.update(event["recipients"])
+        if self.latitude is None:
+            self.latitude = parse_coordinate(event["latitude"])
+            self.longitude = parse_coordinate(event["longitude"])
+
+        if self.severity is None or SEVERITY_RANK.get(event["severity"], 0) >= SEVERITY_RANK.get(self.severity, 0):
+            self.severity = event["severity"]
+        value = parse_confidence(event["confidence"])
+        if self.confidence_label is None or (value is not None and (self.confidence is None or value >= self.confidence)):
+            self.confidence = value
+            self.confidence_label = event["confidence"]
+        self.dirty = True
+
+    def snapshot(self) -> dict:
+        return {
+            "session_id": self.session_id, "camera_id": self.camera_id, "event_type": self.event_type,
+            "created_at": to_timestamp(self.created_at), "status": self.status, "video_path": self.video_path,
+            "description": self.description, "verdict": self.verdict, "severity": self.severity, "confidence": self.confidence,
+            "confidence_label": self.confidence_label, "latitude": self.latitude, "longitude": self.longitude,
+            "recipients": sorted(self.recipients), "notify_to": ",".join(sorted(self.recipients)),
+        }
+
+
+class IncidentAggregator:
+    """
+    Merges incoming clips into incidents in memory and writes them behind.
+
+    A hot camera can report the same event every few seconds. Rather than a
+    read-modify-write on SQLite per clip, the active incident for each
+    (camera, event type) is kept in memory for `window_seconds` from its
+    creation, with its clip list and peak severity and confidence. Dirty
+    incidents are written out together in one transaction every
+    `flush_interval` seconds, or sooner once `max_pending` clips are waiting.
+    Only the first event for a key after a restart reads the database, to
+    pick up an incident that is still active.
+
+    Every event is appended to a journal file before it is acknowledged. A
+    flush first moves the journal aside, and deletes that copy only after
+    its transaction commits; on startup any leftover journal is replayed.
+    Replay is idempotent (sessions are inserted with their journaled id,
+    clips already attached are skipped), so a crash at any point neither
+    loses nor duplicates clips.
+
+    `on_flush(results)` is awaited after each committed flush with
+    (event_type, session_id, [(sha256, path) of clips needing a transcode]).
+    """
+
+    def __init__(self, db: Database, journal_path: str, on_flush: Callable[[list], Awaitable[None]],
+                 window_seconds: float = 1800, flush_interval: float = 1.0, max_pending: int = 100):
+        self.db = db
+        self.journal_path = journal_path
+        self.flushing_path = journal_path + ".flushing"
+        self.on_flush = on_flush
+        self.window_seconds = window_seconds
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.active: Dict[Tuple[str, str], Incident] = {}
+        self.pending_hashes: Dict[str, str] = {}
+        self.pending_count = 0
+        self.key_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.flush_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.journal = None
+        self.task = None
+
+    async def start(self):
+        recovered = self.collect_journal()
+        for event in recovered:
+            await self.replay(event)
+        self.journal = open(self.journal_path, "a")
+        if recovered:
+            print(f"Recovered {len(recovered)} unflushed clip(s) from {self.journal_path}")
+            await self.flush()
+        self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self.journal:
+            self.journal.close()
+
+    def collect_journal(self) -> List[dict]:
+        """Moves everything journaled but not yet committed into the .flushing file and returns it."""
+        self.rotate_journal()
+        if not os.path.exists(self.flushing_path):
+            return []
+        events = []
+        with open(self.flushing_path) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash mid-write was never acknowledged
+                    continue
+        return events
+
+    def rotate_journal(self):
+        if self.journal:
+            self.journal.close()
+        if os.path.exists(self.journal_path):
+            if os.path.exists(self.flushing_path):
+                # A previous flush failed; keep its events and add the new ones
+                with open(self.journal_path) as src, open(self.flushing_path, "a") as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.flushing_path)
+        if self.journal:
+            self.journal = open(self.journal_path, "a")
+
+    def lock_for(self, key) -> asyncio.Lock:
+        return self.key_locks.setdefault(key, asyncio.Lock())
+
+    async def find_clip(self, sha256: str) -> Optional[str]:
+        """Session a clip already belongs to, if any."""
+        if sha256 in self.pending_hashes:
+            return self.pending_hashes[sha256]
+        row = await self.db.read(lambda conn: conn.execute(
+            "SELECT session_id FROM session_videos WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone())
+        return row["session_id"] if row else None
+
+    async def load_active(self, camera_id: str, event_type: str, now: float) -> Optional[Incident]:
+        row = await self.db.read(lambda conn: conn.execute(
+            f"SELECT {INCIDENT_COLUMNS} FROM sessions "
+            "WHERE camera_id = ? AND event_type = ? AND created_at >= ? ORDER BY created_at DESC LIMIT 1",
+            (camera_id, event_type, to_timestamp(now - self.window_seconds))).fetchone())
+        return Incident.from_row(row) if row else None
+
+    async def load_session(self, session_id: str) -> Optional[Incident]:
+        row = await self.db.read(lambda conn: conn.execute(
+            f"SELECT {INCIDENT_COLUMNS} FROM sessions WHERE session_id = ?",
+            (session_id,)).fetchone())
+        return Incident.from_row(row) if row else None
+
+    def unflushed(self, session_id: str) -> Optional[dict]:
+        """Snapshot of an incident whose session row has not been written yet."""
+        for incident in self.active.values():
+            if incident.session_id == session_id and not incident.persisted:
+                return incident.snapshot()
+        return None
+
+    def set_status(self, session_id: str, status: str):
+        """Keeps an active incident in step with a review written straight to the database."""
+        for incident in self.active.values():
+            if incident.session_id == session_id:
+                incident.status = status
+
+    def expired(self, incident: Incident, now: float) -> bool:
+        return now - incident.created_at > self.window_seconds
+
+    async def add(self, event: dict) -> Tuple[Optional[str], dict]:
+        """
+        Adds a stored clip (video_path, sha256, size, camera_id, event_type, description,
+        verdict, recipients, latitude, longitude, severity, confidence). Returns ("created" | "updated",
+        incident snapshot), or (None, {"session_id": ...}) if the clip already belongs to a session.
+        """
+        key = (event["camera_id"], event["event_type"])
+        async with self.lock_for(key):
+            # Under the lock, so the same clip sent twice at once is only merged once
+            existing = await self.find_clip(event["sha256"])
+            if existing:
+                print(f"Clip {event['sha256'][:12]} already belongs to session {existing}")
+                return None, {"session_id": existing}
+
+            now = time.time()
+            incident = self.active.get(key)
+            if incident is None or self.expired(incident, now):
+                incident = await self.load_active(event["camera_id"], event["event_type"], now)
+            if incident is None:
+                incident = Incident(str(uuid.uuid4()), event["camera_id"], event["event_type"], now)
+                event_type = "created"
+            else:
+                print(f"Updating active session {incident.session_id} for camera {incident.camera_id} ({incident.event_type})")
+                event_type = "updated"
+            self.active[key] = incident
+
+            event = {**event, "session_id": incident.session_id, "created_at": incident.created_at, "ts": now}
+            # Journal before acknowledging, synced to disk so it survives a crash or power loss
+            self.journal.write(json.dumps(event) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+            incident.apply(event)
+            self.pending_hashes[event["sha256"]] = incident.session_id
+            self.pending_count += 1
+            if self.pending_count >= self.max_pending:
+                self.wakeup.set()
+            return event_type, incident.snapshot()
+
+    async def replay(self, event: dict):
+        key = (event["camera_id"], event["event_type"])
+        incident = self.active.get(key)
+        if incident is None or incident.session_id != event["session_id"]:
+            incident = await self.load_session(event["session_id"]) or Incident(
+                event["session_id"], event["camera_id"], event["event_type"], event["created_at"])
+            self.active[key] = incident
+        incident.apply(event)
+        self.pending_hashes[event["sha256"]] = incident.session_id
+        self.pending_count += 1
+
+    async def import_events(self, events: List[dict]):
+        """
+        Writes historical events straight to the database in a single transaction,
+        merged into incidents by the same camera / event type / window rule using each
+        event's own `ts`, including sessions already in the database (such as an earlier
+        import batch). Returns (results as passed to on_flush, [(event, session_id) for
+        clips that were already stored]).
+        """
+        fresh, skipped, batch_hashes = [], [], set()
+        for event in events:
+            if event["sha256"] in batch_hashes:
+                # Same clip twice in one import; it ends up wherever the first copy goes
+                skipped.append((event, None))
+                continue
+            existing = await self.find_clip(event["sha256"])
+            if existing:
+                skipped.append((event, existing))
+            else:
+                batch_hashes.add(event["sha256"])
+                fresh.append(event)
+
+        groups: List[List[dict]] = []
+        owner: Dict[str, int] = {}
+        open_groups: Dict[Tuple[str, str], List[dict]] = {}
+        for event in sorted(fresh, key=lambda e: e["ts"]):
+            key = (event["camera_id"], event["event_type"])
+            group = open_groups.get(key)
+            if group is None or event["ts"] - group[0]["ts"] > self.window_seconds:
+                group = open_groups[key] = []
+                groups.append(group)
+            group.append(event)
+            owner[event["sha256"]] = len(groups) - 1
+
+        results = await self.write_import_locked(groups) if groups else []
+        skipped = [(event, session_id or results[owner[event["sha256"]]][1]) for event, session_id in skipped]
+        if results:
+            await self.on_flush(results)
+        return results, skipped
+
+    async def write_import_locked(self, groups: List[List[dict]]):
+        """
+        Runs write_import under the key locks of every camera / event type it touches. An
+        active incident for one of them may hold clips that are only in memory, and the
+        duplicate check reads the database, so those incidents are flushed first; afterwards
+        they are dropped from memory, to be reloaded with the imported clips by the next add().
+        """
+        keys = sorted({(events[0]["camera_id"], events[0]["event_type"]) for events in groups})
+        async with AsyncExitStack() as stack:
+            for key in keys:
+                await stack.enter_async_context(self.lock_for(key))
+            if any(key in self.active for key in keys):
+                await self.flush()
+                if any(self.active[key].dirty for key in keys if key in self.active):
+                    raise RuntimeError("Active incidents could not be written, try the import again")
+            results = await self.db.write(self.write_import, groups)
+            for key in keys:
+                self.active.pop(key, None)
+        return results
+
+    def write_import(self, conn, groups):
+        batch = []
+        for events in groups:
+            first = events[0]
+            row = conn.execute(
+                f"SELECT {INCIDENT_COLUMNS} FROM sessions "
+                "WHERE camera_id = ? AND event_type = ? AND created_at BETWEEN ? AND ? ORDER BY created_at DESC LIMIT 1",
+                (first["camera_id"], first["event_type"], to_timestamp(first["ts"] - self.window_seconds), to_timestamp(first["ts"]))
+            ).fetchone()
+            if row:
+                incident = Incident.from_row(row)
+            else:
+                incident = Incident(str(uuid.uuid4()), first["camera_id"], first["event_type"], first["ts"],
+                                    status=first.get("status") or "pending")
+            for event in events:
+                incident.apply(event)
+            batch.append((incident.snapshot(), incident.pending_clips, incident.persisted))
+        return self.write_batch(conn, batch)
+
+    def write_batch(self, conn, batch):
+        results = []
+        for snap, clips, was_persisted in batch:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, video_path, description, verdict, status, created_at, camera_id, "
+                "event_type, latitude, longitude, severity, confidence, confidence_label) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (snap["session_id"], snap["video_path"], snap["description"], snap["verdict"], snap["status"], snap["created_at"],
+                 snap["camera_id"], snap["event_type"], snap["latitude"], snap["longitude"], snap["severity"], snap["confidence"],
+                 snap["confidence_label"])
+            ).rowcount
+            if not inserted:
+                conn.execute(
+                    "UPDATE sessions SET video_path = ?, description = ?, verdict = ?, severity = ?, confidence = ?, "
+                    "confidence_label = ? WHERE session_id = ?",
+                    (snap["video_path"], snap["description"], snap["verdict"], snap["severity"], snap["confidence"],
+                     snap["confidence_label"], snap["session_id"])
+                )
+            conn.executemany(
+                "INSERT OR IGNORE INTO session_recipients (session_id, recipient) VALUES (?, ?)",
+                [(snap["session_id"], recipient) for recipient in snap["recipients"]]
+            )
+
+            transcode = []
+            for clip in clips:
+                if conn.execute("SELECT 1 FROM session_videos WHERE sha256 = ?", (clip["sha256"],)).fetchone():
+                    continue
+                conn.execute(
+                    "INSERT INTO clips (sha256, path, size) VALUES (?, ?, ?) "
+                    "ON CONFLICT(sha256) DO UPDATE SET path = excluded.path, size = excluded.size",
+                    (clip["sha256"], clip["video_path"], clip["size"])
+                )
+                conn.execute(
+                    "INSERT INTO session_videos (session_id, video_path, sha256, size, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (snap["session_id"], clip["video_path"], clip["sha256"], clip["size"], to_timestamp(clip["ts"]))
+                )
+                status = conn.execute("SELECT transcode_status FROM clips WHERE sha256 = ?", (clip["sha256"],)).fetchone()[0]
+                if status == "pending":
+                    transcode.append((clip["sha256"], clip["video_path"]))
+            results.append(("updated" if was_persisted else "created", snap["session_id"], transcode))
+        return results
+
+    async def flush(self):
+        async with self.flush_lock:
+            dirty = [incident for incident in self.active.values() if incident.dirty]
+            if not dirty:
+                return
+            # Taking the batch and moving the journal aside happen together, with no await in between
+            batch = []
+            for incident in dirty:
+                batch.append((incident.snapshot(), incident.pending_clips, incident.persisted))
+                incident.pending_clips = []
+                incident.dirty = False
+            self.pending_count = 0
+            self.rotate_journal()
+
+            try:
+                results = await self.db.write(self.write_batch, batch)
+            except Exception as e:
+                print(f"Incident flush failed, will retry: {e}")
+                for incident, (_, clips, _) in zip(dirty, batch):
+                    incident.pending_clips = clips + incident.pending_clips
+                    incident.dirty = True
+                    self.pending_count += len(clips)
+                return
+
+            if os.path.exists(self.flushing_path):
+                os.remove(self.flushing_path)
+            for incident, (_, clips, _) in zip(dirty, batch):
+                incident.persisted = True
+                for clip in clips:
+                    self.pending_hashes.pop(clip["sha256"], None)
+
+        try:
+            await self.on_flush(results)
+        except Exception as e:
+            print(f"Error after incident flush: {e}")
+
+    def evict(self):
+        now = time.time()
+        for key, incident in list(self.active.items()):
+            lock = self.key_locks.get(key)
+            if not incident.dirty and self.expired(incident, now) and not (lock and lock.locked()):
+                del self.active[key]
+                self.key_locks.pop(key, None)
+
+    async def loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+            self.evict()
@@ -0,0 +1,424 @@
+"""
+Load-test harness for the session service.
+
+Starts a throwaway instance of this service in a temporary directory, with the
+messenger and Firebase replaced by a local stub, runs one or more scenarios
+against it and reports throughput and p50/p95/p99 latency per endpoint:
+
+    upload   bursts of concurrent POST /upload calls with clip files
+    poll     many dashboards polling GET /sessions with ETags while clips trickle in
+    approve  an approve storm over freshly imported sessions, including how long the
+             outbox takes to deliver every notification to the stubs
+
+Results are saved as JSON under loadtest_results/ so runs can be compared:
+
+    python loadtest.py                                  # all scenarios
+    python loadtest.py upload --clients 32 --requests 20 --clip sample.mp4
+    python loadtest.py all --compare loadtest_results/20260101-120000-all.json
+    python loadtest.py poll --url http://localhost:8002  # an instance you started yourself
+
+With --url nothing is started; point that instance's MESSENGER_API_URL and FIREBASE_URL
+at a stub (python loadtest.py stub) so approvals don't send real messages.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(SERVICE_DIR, "loadtest_results")
+PERCENTILES = (50, 95, 99)
+EVENT_TYPES = ["Fire", "Violence", "Stampede", "Weapon"]
+
+local = threading.local()
+
+
+def http_session():
+    # requests.Session is not thread-safe; one per worker thread keeps connections pooled
+    if not hasattr(local, "session"):
+        local.session = requests.Session()
+    return local.session
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    """Latencies and outcomes per endpoint, shared by all client threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def call(self, endpoint, method, url, ok=(200, 201, 204, 304), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = http_session().request(method, url, **kwargs)
+            status = response.status_code
+        except requests.RequestException as e:
+            response, status = None, type(e).__name__
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            self.statuses[endpoint][str(status) if status in ok else f"error {status}"] += 1
+        return response if status in ok else None
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        duration = (self.finished or time.perf_counter()) - self.started
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            errors = sum(n for status, n in self.statuses[endpoint].items() if status.startswith("error"))
+            stats = {
+                "requests": len(values),
+                "errors": errors,
+                "throughput_rps": round(len(values) / duration, 2) if duration else None,
+                "mean_ms": round(1000 * sum(values) / len(values), 2),
+                "max_ms": round(1000 * values[-1], 2),
+                "statuses": dict(self.statuses[endpoint]),
+            }
+            for p in PERCENTILES:
+                stats[f"p{p}_ms"] = round(1000 * percentile(values, p), 2)
+            endpoints[endpoint] = stats
+        return {"duration_s": round(duration, 3), "endpoints": endpoints}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Accepts messenger (POST /send-message) and Firebase (PUT /led/state.json) calls."""
+
+    def handle_call(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        with server.lock:
+            server.calls[f"{self.command} {self.path.split('?')[0]}"] += 1
+        body = b'{"status": "sent"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_PUT = handle_call
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port=0, delay=0.0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.lock = threading.Lock()
+    server.calls = Counter()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_calls(stub):
+    with stub.lock:
+        return sum(stub.calls.values())
+
+
+class LocalService:
+    """This service under uvicorn in a temporary working directory, wired to the stub."""
+
+    def __init__(self, stub_url, port, phones, extra_env=None):
+        self.workdir = tempfile.mkdtemp(prefix="crowd-shield-loadtest-")
+        self.url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ)
+        env.update({
+            "MESSENGER_API_URL": f"{stub_url}/send-message",
+            "FIREBASE_URL": f"{stub_url}/led/state.json",
+            "NOTIFY_PHONE_NUMBERS": ",".join(phones),
+            "INCIDENT_JOURNAL": os.path.join(self.workdir, "incidents.journal"),
+            # Keep background passes out of the measurements
+            "RETENTION_INTERVAL_MINUTES": "0",
+        })
+        env.update(extra_env or {})
+        self.log = open(os.path.join(self.workdir, "service.log"), "wb")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", SERVICE_DIR,
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                if requests.get(f"{self.url}/retention", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.close()
+        raise RuntimeError(f"Session service did not start; see {self.log.name}")
+
+    def close(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.log.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class ClipSource:
+    """Upload payloads. Every clip gets unique trailing bytes so none is deduplicated away."""
+
+    def __init__(self, clip_path=None, clip_kb=512):
+        if clip_path:
+            with open(clip_path, "rb") as f:
+                self.base = f.read()
+        else:
+            self.base = os.urandom(clip_kb * 1024)
+
+    def next(self):
+        return self.base + uuid.uuid4().bytes
+
+
+def upload(rec, url, clips, camera, event_type, endpoint="POST /upload"):
+    return rec.call(endpoint, "POST", f"{url}/upload", files={"file": ("loadtest.mp4", clips.next(), "video/mp4")}, data={
+        "description": f"Security Alert: {event_type} detected!",
+        "notify_to": "admin",
+        "camera_id": camera,
+        "event_type": event_type,
+        "severity": "Critical",
+        "confidence": "90%",
+    }, timeout=120)
+
+
+def scenario_upload(url, args, stub):
+    """`clients` threads each upload `requests` clips as fast as they can."""
+    rec = Recorder()
+    clips = ClipSource(args.clip, args.clip_kb)
+
+    def client(n):
+        for i in range(args.requests):
+            upload(rec, url, clips, f"lt-cam{(n + i) % args.cameras}", EVENT_TYPES[i % len(EVENT_TYPES)])
+
+    with ThreadPoolExecutor(args.clients) as pool:
+        list(pool.map(client, range(args.clients)))
+    rec.stop()
+    return rec.summary()
+
+
+def scenario_poll(url, args, stub):
+    """`dashboards` threads poll /sessions for `duration` seconds while one writer keeps changing it."""
+    rec = Recorder()
+    clips = ClipSource(None, 64)
+    stop = threading.Event()
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            upload(rec, url, clips, f"lt-cam{i % args.cameras}", EVENT_TYPES[i % len(EVENT_TYPES)], "POST /upload (background)")
+            i += 1
+            stop.wait(args.write_interval)
+
+    def dashboard(_):
+        etag = None
+        deadline = time.time() + args.duration
+        while time.time() < deadline:
+            headers = {"If-None-Match": etag} if etag else {}
+            response = rec.call("GET /sessions", "GET", f"{url}/sessions", headers=headers,
+                                params={"limit": 50, "order": "desc"}, timeout=30)
+            if response is not None:
+                etag = response.headers.get("ETag", etag)
+            time.sleep(args.poll_interval)
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+    with ThreadPoolExecutor(args.dashboards) as pool:
+        list(pool.map(dashboard, range(args.dashboards)))
+    stop.set()
+    writer_thread.join()
+    rec.stop()
+    return rec.summary()
+
+
+def seed_sessions(url, count):
+    """Pending sessions created through /import, one camera each so none are merged."""
+    clips = ClipSource(None, 16)
+    session_ids = []
+    run = uuid.uuid4().hex[:6]
+    for start in range(0, count, 50):
+        batch = range(start, min(start + 50, count))
+        files = [("files", (f"seed{i}.mp4", clips.next(), "video/mp4")) for i in batch]
+        manifest = [{"camera_id": f"lt-{run}-{i}", "event_type": "Fire", "severity": "Critical"} for i in batch]
+        response = requests.post(f"{url}/import", files=files, data={"manifest": json.dumps(manifest)}, timeout=120)
+        response.raise_for_status()
+        session_ids.extend(s["session_id"] for s in response.json()["sessions"])
+    return session_ids
+
+
+def scenario_approve(url, args, stub):
+    """Approves `sessions` seeded sessions with `clients` threads, then waits for the outbox to drain."""
+    session_ids = seed_sessions(url, args.sessions)
+    before = stub_calls(stub) if stub else 0
+    rec = Recorder()
+
+    def approve(session_id):
+        rec.call("POST /session/{id}/approve", "POST", f"{url}/session/{session_id}/approve", timeout=60)
+
+    with ThreadPoolExecutor(args.clients) as pool:
+        list(pool.map(approve, session_ids))
+    rec.stop()
+    result = rec.summary()
+
+    if stub:
+        # One message per phone number plus the Firebase alarm per approval
+        expected = len(session_ids) * (len(args.phones) + 1)
+        deadline = time.time() + args.drain_timeout
+        while stub_calls(stub) - before < expected and time.time() < deadline:
+            time.sleep(0.05)
+        delivered = stub_calls(stub) - before
+        result["outbox"] = {
+            "expected": expected,
+            "delivered": delivered,
+            "drain_s": round(time.perf_counter() - rec.started, 3) if delivered >= expected else None,
+        }
+    return result
+
+
+SCENARIOS = {"upload": scenario_upload, "poll": scenario_poll, "approve": scenario_approve}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_results(name, result):
+    print(f"\n== {name} ({result['duration_s']}s) ==")
+    print(f"{'endpoint':<34}{'reqs':>7}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"{endpoint:<34}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    if "outbox" in result:
+        outbox = result["outbox"]
+        drained = f"drained in {outbox['drain_s']}s" if outbox["drain_s"] is not None else "did not drain"
+        print(f"outbox: {outbox['delivered']}/{outbox['expected']} notifications delivered, {drained}")
+
+
+def print_comparison(previous, current):
+    print(f"\n== compared with {previous.get('revision') or '?'} at {previous['started_at']} ==")
+    for name, result in current["scenarios"].items():
+        old = previous["scenarios"].get(name)
+        if not old:
+            continue
+        for endpoint, stats in result["endpoints"].items():
+            before = old["endpoints"].get(endpoint)
+            if not before:
+                continue
+            changes = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                if before[key]:
+                    changes.append(f"{key} {before[key]} -> {stats[key]} ({100 * (stats[key] - before[key]) / before[key]:+.0f}%)")
+            print(f"{name} {endpoint}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the session service.")
+    parser.add_argument("scenario", nargs="?", default="all", choices=["all", "stub"] + list(SCENARIOS),
+                        help="Scenario to run, or 'stub' to only run the messenger/Firebase stub")
+    parser.add_argument("--url", help="Test an already running instance instead of starting one")
+    parser.add_argument("--port", type=int, default=8802, help="Port for the instance started here")
+    parser.add_argument("--stub-port", type=int, default=0, help="Port for the stub (default: any free port)")
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="Seconds the stub takes per call")
+    parser.add_argument("--phones", default="+10000000001,+10000000002",
+                        help="NOTIFY_PHONE_NUMBERS for the instance started here")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent clients for upload and approve")
+    parser.add_argument("--requests", type=int, default=10, help="Uploads per client")
+    parser.add_argument("--clip", help="Clip file to upload (default: random bytes)")
+    parser.add_argument("--clip-kb", type=int, default=512, help="Size of the random clip")
+    parser.add_argument("--cameras", type=int, default=8, help="Cameras uploads are spread over")
+    parser.add_argument("--dashboards", type=int, default=50, help="Concurrent dashboards for poll")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds each dashboard polls")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between a dashboard's polls")
+    parser.add_argument("--write-interval", type=float, default=0.5, help="Seconds between background uploads in poll")
+    parser.add_argument("--sessions", type=int, default=200, help="Sessions approved in approve")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="Seconds to wait for the outbox to drain")
+    parser.add_argument("--out", help="Results file (default: loadtest_results/<time>-<scenario>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+    args.phones = [p for p in args.phones.split(",") if p.strip()]
+
+    stub = None if args.url and args.scenario != "stub" else start_stub(args.stub_port, args.stub_delay)
+    if args.scenario == "stub":
+        print(f"Stub listening on http://127.0.0.1:{stub.server_port} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"Calls so far: {dict(stub.calls)}")
+        except KeyboardInterrupt:
+            return
+
+    service = None
+    if not args.url:
+        stub_url = f"http://127.0.0.1:{stub.server_port}"
+        service = LocalService(stub_url, args.port, args.phones)
+        print(f"Started session service in {service.workdir}")
+    url = (args.url or service.url).rstrip("/")
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    run = {
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "revision": git_revision(),
+        "target": args.url or "local",
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "scenarios": {},
+    }
+    try:
+        for name in names:
+            print(f"Running {name}...")
+            run["scenarios"][name] = SCENARIOS[name](url, args, stub)
+            print_results(name, run["scenarios"][name])
+    finally:
+        if service:
+            service.close()
+        if stub:
+            stub.shutdown()
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.scenario}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nSaved results to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), run)
+
+
+if __name__ == "__main__":
+    main()
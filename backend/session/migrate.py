@@ -0,0 +1,40 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from db import Database
+from schema import SCHEMA_VERSION, migrate, schema_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade a crowd_shield.db file to the current session schema in place.")
+    parser.add_argument("db", nargs="?", default="crowd_shield.db", help="Path to the SQLite database")
+    parser.add_argument("--target", type=int, default=SCHEMA_VERSION, help="Schema version to migrate to")
+    parser.add_argument("--no-backup", action="store_true", help="Skip the online backup taken before migrating")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist")
+
+    conn = Database(args.db).connect()
+    current = schema_version(conn)
+    print(f"{args.db}: schema v{current}, target v{args.target}")
+    if current >= args.target:
+        print("Nothing to do.")
+        return
+
+    if not args.no_backup:
+        backup_path = f"{args.db}.v{current}.{time.strftime('%Y%m%d_%H%M%S')}.bak"
+        with sqlite3.connect(backup_path) as backup:
+            conn.backup(backup)
+        print(f"Backup written to {backup_path}")
+
+    start = time.time()
+    migrate(conn, args.target)
+    conn.close()
+    print(f"Done in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from db import Database
+
+# Client errors other than these mean the request itself is wrong; retrying will not help
+RETRYABLE_STATUS = {408, 425, 429}
+
+
+class PermanentError(Exception):
+    pass
+
+
+def enqueue(conn, kind: str, session_id: str, payload: dict):
+    """Adds a job to the outbox. Call it inside the transaction that makes the job necessary."""
+    conn.execute(
+        "INSERT INTO outbox (kind, session_id, payload, next_attempt_at) VALUES (?, ?, ?, ?)",
+        (kind, session_id, json.dumps(payload), time.time())
+    )
+
+
+def http_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def check_response(response: requests.Response):
+    if response.status_code < 400:
+        return
+    message = f"HTTP {response.status_code}: {response.text[:200]}"
+    if response.status_code < 500 and response.status_code not in RETRYABLE_STATUS:
+        raise PermanentError(message)
+    raise RuntimeError(message)
+
+
+class OutboxDispatcher:
+    """
+    Delivers outbox jobs (schema v6) in the background.
+
+    Handlers write jobs with `enqueue()` in the same transaction as the state
+    change that causes them, so a job exists exactly when that change was
+    committed, and then call `wake()`. The dispatcher claims due jobs, runs
+    each kind's sender on a bounded thread pool, and records the outcome:
+    `delivered`, back to `pending` with exponential backoff, or `failed` after
+    `max_attempts` or a non-retryable error. Jobs left `sending` by a crash
+    are picked up again on start, so delivery is at-least-once.
+
+    Senders are plain blocking functions taking the decoded payload; they
+    raise to report failure (PermanentError to skip the retries).
+    """
+
+    def __init__(self, db: Database, senders: Dict[str, Callable[[dict], None]], concurrency: int = 4,
+                 max_attempts: int = 8, base_delay: float = 2.0, max_delay: float = 300.0, poll_interval: float = 5.0):
+        self.db = db
+        self.senders = senders
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="outbox")
+        self.in_flight = 0
+        self.slot_free = asyncio.Event()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def wake(self):
+        self.wakeup.set()
+
+    async def start(self):
+        await self.db.write(lambda conn: conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'"))
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.pool.shutdown(wait=True)
+
+    def _claim(self, conn, limit, now):
+        return conn.execute(
+            "UPDATE outbox SET status = 'sending', attempts = attempts + 1 "
+            "WHERE id IN (SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?) "
+            "RETURNING id, kind, session_id, payload, attempts",
+            (now, limit)
+        ).fetchall()
+
+    def _next_due(self, conn):
+        row = conn.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            free = self.concurrency - self.in_flight
+            if free > 0:
+                for job in await self.db.write(self._claim, free, time.time()):
+                    self.in_flight += 1
+                    asyncio.create_task(self.deliver(dict(job)))
+
+            if self.in_flight >= self.concurrency:
+                self.slot_free.clear()
+                await self.slot_free.wait()
+                continue
+
+            next_due = await self.db.read(self._next_due)
+            timeout = self.poll_interval if next_due is None else min(self.poll_interval, max(0.0, next_due - time.time()))
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def deliver(self, job):
+        loop = asyncio.get_running_loop()
+        error = None
+        permanent = False
+        try:
+            sender = self.senders.get(job["kind"])
+            if sender is None:
+                raise PermanentError(f"No sender for {job['kind']}")
+            await loop.run_in_executor(self.pool, sender, json.loads(job["payload"]))
+        except PermanentError as e:
+            error, permanent = str(e), True
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        try:
+            if error is None:
+                await self.db.write(lambda conn: conn.execute(
+                    "UPDATE outbox SET status = 'delivered', delivered_at = CURRENT_TIMESTAMP, last_error = NULL WHERE id = ?",
+                    (job["id"],)))
+                print(f"Outbox {job['kind']} job {job['id']} delivered for session {job['session_id']}")
+            elif permanent or job["attempts"] >= self.max_attempts:
+                await self.db.write(lambda conn: conn.execute(
+                    "UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?", (error, job["id"])))
+                print(f"Outbox {job['kind']} job {job['id']} failed after {job['attempts']} attempt(s): {error}")
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (job["attempts"] - 1))
+                await self.db.write(lambda conn: conn.execute(
+                    "UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (time.time() + delay, error, job["id"])))
+                print(f"Outbox {job['kind']} job {job['id']} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {error}")
+        finally:
+            self.in_flight -= 1
+            self.slot_free.set()
+            self.wake()
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+from db import Database
+from schema import index_session_locations, index_session_text
+from transcode import Transcoder
+
+DAY = 24 * 3600
+BATCH_SIZE = 200
+# How long deleted sessions are still reported to `since=` pollers
+TOMBSTONE_DAYS = 30
+
+
+def _remove_quietly(path: Optional[str]) -> int:
+    if not path:
+        return 0
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+class RetentionEngine:
+    """
+    Keeps the session service's disk and database bounded.
+
+    Each pass, in order:
+
+    * deletes sessions past their status's retention period (`retain_days`,
+      e.g. {"rejected": 7}; statuses left out or set to 0 are kept forever),
+      together with their clip history, recipients, aliases and outbox jobs,
+      and forgets the tombstones of sessions deleted over `TOMBSTONE_DAYS` ago;
+    * re-encodes clips used only by approved sessions older than
+      `downsample_after_days` to a low-bitrate archive copy, replacing the
+      original and its web copy;
+    * deletes clips no session references any more (`ref_count` 0);
+    * deletes files under the upload directory that nothing in the database
+      points at, once they are older than `orphan_grace_seconds` (so uploads
+      still being moved into place are left alone);
+    * returns free pages to the filesystem with `PRAGMA incremental_vacuum`
+      and truncates the WAL.
+
+    Database changes are committed before the matching files are removed, so
+    a crash in between leaves orphans for the next pass rather than rows
+    pointing at missing files.
+    """
+
+    def __init__(self, db: Database, transcoder: Transcoder, upload_dir: str, temp_dir: str, archive_dir: str,
+                 retain_days: Dict[str, float], downsample_after_days: float = 30, archive_height: int = 480,
+                 archive_crf: int = 32, orphan_grace_seconds: float = 3600, interval_seconds: float = 3600,
+                 vacuum_pages: int = 2000):
+        self.db = db
+        self.transcoder = transcoder
+        self.upload_dir = upload_dir
+        self.temp_dir = temp_dir
+        self.archive_dir = archive_dir
+        self.retain_days = retain_days
+        self.downsample_after_days = downsample_after_days
+        self.archive_height = archive_height
+        self.archive_crf = archive_crf
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.interval_seconds = interval_seconds
+        self.vacuum_pages = vacuum_pages
+        self.lock = asyncio.Lock()
+        self.last_run: Optional[dict] = None
+        self.task = None
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def start(self):
+        if self.interval_seconds > 0:
+            self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Retention pass failed: {e}")
+
+    async def run_once(self) -> dict:
+        async with self.lock:
+            start = time.time()
+            stats = {
+                "sessions_deleted": await self.expire_sessions(),
+                "clips_downsampled": 0,
+                "clips_deleted": 0,
+                "orphans_deleted": 0,
+                "bytes_freed": 0,
+            }
+            downsampled, freed = await self.downsample_clips()
+            stats["clips_downsampled"] = downsampled
+            stats["bytes_freed"] += freed
+            stats["clips_deleted"], freed = await self.collect_clips()
+            stats["bytes_freed"] += freed
+            stats["orphans_deleted"], freed = await self.remove_orphans()
+            stats["bytes_freed"] += freed
+            stats["db_pages_freed"] = await self.db.write(self.vacuum)
+            stats["seconds"] = round(time.time() - start, 3)
+            stats["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            self.last_run = stats
+            print(f"Retention pass: {stats}")
+            return stats
+
+    def _expire_batch(self, conn, status, cutoff):
+        ids = [row[0] for row in conn.execute(
+            "SELECT session_id FROM sessions WHERE status = ? AND created_at < datetime(?, 'unixepoch') LIMIT ?",
+            (status, cutoff, BATCH_SIZE)
+        ).fetchall()]
+        if not ids:
+            return 0
+        marks = ",".join("?" * len(ids))
+        for table in ("session_videos", "session_recipients", "session_aliases", "outbox"):
+            conn.execute(f"DELETE FROM {table} WHERE session_id IN ({marks})", ids)
+        conn.execute(f"DELETE FROM sessions WHERE session_id IN ({marks})", ids)
+        return len(ids)
+
+    def _forget_tombstones(self, conn, cutoff):
+        conn.execute("DELETE FROM session_tombstones WHERE deleted_at < datetime(?, 'unixepoch')", (cutoff,))
+
+    async def expire_sessions(self) -> int:
+        deleted = 0
+        for status, days in self.retain_days.items():
+            if not days:
+                continue
+            cutoff = time.time() - days * DAY
+            # Small batches keep each write transaction short
+            while True:
+                count = await self.db.write(self._expire_batch, status, cutoff)
+                deleted += count
+                if count < BATCH_SIZE:
+                    break
+        await self.db.write(self._forget_tombstones, time.time() - TOMBSTONE_DAYS * DAY)
+        return deleted
+
+    def _downsample_candidates(self, conn, cutoff):
+        return conn.execute(
+            "SELECT c.sha256, c.path, c.web_path, c.size FROM clips c "
+            "WHERE c.tier = 'original' AND c.ref_count > 0 AND NOT EXISTS ("
+            "  SELECT 1 FROM session_videos v JOIN sessions s ON s.session_id = v.session_id "
+            "  WHERE v.sha256 = c.sha256 AND (s.status != 'approved' OR s.created_at >= datetime(?, 'unixepoch'))"
+            ") LIMIT ?",
+            (cutoff, BATCH_SIZE)
+        ).fetchall()
+
+    def _archive(self, conn, sha256, old_path, archive_path, size):
+        conn.execute(
+            "UPDATE clips SET path = ?, web_path = ?, size = ?, tier = 'archived' WHERE sha256 = ?",
+            (archive_path, archive_path, size, sha256)
+        )
+        conn.execute("UPDATE session_videos SET video_path = ? WHERE sha256 = ?", (archive_path, sha256))
+        conn.execute("UPDATE sessions SET video_path = ? WHERE video_path = ?", (archive_path, old_path))
+
+    async def downsample_clips(self):
+        if not self.downsample_after_days or not self.transcoder.available:
+            return 0, 0
+        cutoff = time.time() - self.downsample_after_days * DAY
+        downsampled = freed = 0
+        for clip in await self.db.read(self._downsample_candidates, cutoff):
+            sha256, old_path = clip["sha256"], clip["path"]
+            archive_path = os.path.join(self.archive_dir, f"{sha256}.mp4")
+            try:
+                await self.transcoder.downsample(old_path, archive_path, self.archive_height, self.archive_crf)
+            except Exception as e:
+                print(f"Could not downsample clip {sha256[:12]}: {e}")
+                continue
+
+            size = os.path.getsize(archive_path)
+            if size >= clip["size"]:
+                # Already small; keep the original and don't try again
+                os.remove(archive_path)
+                await self.db.write(lambda conn: conn.execute("UPDATE clips SET tier = 'archived' WHERE sha256 = ?", (sha256,)))
+                continue
+
+            await self.db.write(self._archive, sha256, old_path, archive_path, size)
+            for path in {old_path, clip["web_path"]} - {archive_path}:
+                freed += await asyncio.to_thread(_remove_quietly, path)
+            downsampled += 1
+        return downsampled, freed
+
+    def _take_unreferenced(self, conn):
+        return conn.execute(
+            "DELETE FROM clips WHERE ref_count <= 0 RETURNING path, web_path, poster_path"
+        ).fetchall()
+
+    async def collect_clips(self):
+        rows = await self.db.write(self._take_unreferenced)
+        freed = 0
+        for row in rows:
+            for path in (row["path"], row["web_path"], row["poster_path"]):
+                freed += await asyncio.to_thread(_remove_quietly, path)
+        return len(rows), freed
+
+    def _referenced_paths(self, conn):
+        rows = conn.execute(
+            "SELECT path FROM clips UNION SELECT web_path FROM clips UNION SELECT poster_path FROM clips "
+            "UNION SELECT video_path FROM session_videos UNION SELECT video_path FROM sessions"
+        ).fetchall()
+        return {os.path.normpath(row[0]) for row in rows if row[0]}
+
+    def _sweep(self, referenced):
+        cutoff = time.time() - self.orphan_grace_seconds
+        deleted = freed = 0
+        candidates = []
+        for root, _, files in os.walk(self.upload_dir):
+            candidates.extend(os.path.join(root, name) for name in files)
+        # Leftovers of uploads that died before being moved into the store
+        if os.path.isdir(self.temp_dir):
+            candidates.extend(os.path.join(self.temp_dir, name) for name in os.listdir(self.temp_dir) if name.endswith(".tmp"))
+
+        for path in candidates:
+            if os.path.normpath(path) in referenced:
+                continue
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            freed += _remove_quietly(path)
+            deleted += 1
+        return deleted, freed
+
+    async def remove_orphans(self):
+        referenced = await self.db.read(self._referenced_paths)
+        return await asyncio.to_thread(self._sweep, referenced)
+
+    def vacuum(self, conn) -> int:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Switching an existing database to incremental mode needs one full VACUUM
+            print("Enabling incremental vacuum (one-time full VACUUM)...")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            # VACUUM may renumber the rowids the location and text indexes are keyed by
+            index_session_locations(conn)
+            index_session_text(conn)
+            conn.commit()
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})").fetchall()
+        freed = free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return freed
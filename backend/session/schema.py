@@ -0,0 +1,520 @@
+import re
+import sqlite3
+from typing import Optional
+
+# Bump this and append to MIGRATIONS whenever the schema changes.
+# The applied version is kept in SQLite's own `PRAGMA user_version`.
+SCHEMA_VERSION = 14
+
+CONFIDENCE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*%?\s*$")
+STATUS_RANK = {"pending": 0, "rejected": 1, "approved": 2}
+# Severities the agent reports; "Recall" marks its offline fallback verdicts
+SEVERITY_RANK = {"Normal": 0, "Informational": 1, "Recall": 1, "Warning": 2, "Critical": 3}
+
+
+def parse_coordinate(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_confidence(value) -> Optional[float]:
+    """'85%' / '85' -> 85.0. Free-text labels such as 'Simulated (API Limit)' have no numeric value."""
+    if value is None:
+        return None
+    match = CONFIDENCE_RE.match(str(value))
+    return float(match.group(1)) if match else None
+
+
+def _v1_initial(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            video_path TEXT NOT NULL,
+            description TEXT,
+            notify_to TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            camera_id TEXT,
+            latitude TEXT,
+            longitude TEXT,
+            severity TEXT,
+            confidence TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_videos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            video_path TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+        )
+    ''')
+
+
+def _v2_typed_columns(conn: sqlite3.Connection):
+    """
+    Numeric coordinates/confidence, one row per incident with recipients in
+    their own table, and indexes for the camera lookup and listing queries.
+
+    v1 stored a full copy of the incident for every recipient. Those copies
+    are folded into one session here; the ids of the dropped copies are kept
+    in `session_aliases` so links that were already sent out keep working.
+    """
+    conn.execute('''
+        CREATE TABLE sessions_v2 (
+            session_id TEXT PRIMARY KEY,
+            video_path TEXT NOT NULL,
+            description TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            camera_id TEXT NOT NULL DEFAULT 'cam1',
+            latitude REAL,
+            longitude REAL,
+            severity TEXT,
+            confidence REAL,
+            confidence_label TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE session_recipients (
+            session_id TEXT NOT NULL REFERENCES sessions(session_id),
+            recipient TEXT NOT NULL,
+            PRIMARY KEY (session_id, recipient)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE session_aliases (
+            alias_id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL REFERENCES sessions(session_id)
+        ) WITHOUT ROWID
+    ''')
+
+    rows = conn.execute("SELECT rowid AS row_id, * FROM sessions ORDER BY rowid").fetchall()
+    video_counts = dict(conn.execute("SELECT session_id, COUNT(*) FROM session_videos GROUP BY session_id").fetchall())
+
+    # Per-recipient copies were inserted together, so they share camera, location and creation time
+    groups = {}
+    for row in rows:
+        key = (row["camera_id"], row["created_at"], row["latitude"], row["longitude"])
+        groups.setdefault(key, []).append(row)
+
+    for copies in groups.values():
+        # The copy the 30-minute lookup kept updating has the most clips attached
+        canonical = max(copies, key=lambda r: (video_counts.get(r["session_id"], 0), -r["row_id"]))
+        status = max((r["status"] or "pending" for r in copies), key=lambda s: STATUS_RANK.get(s, 0))
+
+        conn.execute(
+            "INSERT INTO sessions_v2 (session_id, video_path, description, status, created_at, camera_id, latitude, longitude, severity, confidence, confidence_label) "
+            "VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?, ?, ?)",
+            (canonical["session_id"], canonical["video_path"], canonical["description"], status,
+             canonical["created_at"], canonical["camera_id"] or "cam1",
+             parse_coordinate(canonical["latitude"]), parse_coordinate(canonical["longitude"]),
+             canonical["severity"], parse_confidence(canonical["confidence"]), canonical["confidence"])
+        )
+        for copy in copies:
+            if copy["notify_to"]:
+                conn.execute("INSERT OR IGNORE INTO session_recipients (session_id, recipient) VALUES (?, ?)",
+                             (canonical["session_id"], copy["notify_to"]))
+            if copy["session_id"] != canonical["session_id"]:
+                conn.execute("INSERT INTO session_aliases (alias_id, session_id) VALUES (?, ?)",
+                             (copy["session_id"], canonical["session_id"]))
+                conn.execute("UPDATE session_videos SET session_id = ? WHERE session_id = ?",
+                             (canonical["session_id"], copy["session_id"]))
+
+    # Every copy recorded the same clip; keep one history entry per clip
+    conn.execute('''
+        DELETE FROM session_videos WHERE id NOT IN (
+            SELECT MIN(id) FROM session_videos GROUP BY session_id, video_path
+        )
+    ''')
+
+    conn.execute("DROP TABLE sessions")
+    conn.execute("ALTER TABLE sessions_v2 RENAME TO sessions")
+
+    # Active-session lookup on every upload: camera + recent created_at, newest first
+    conn.execute("CREATE INDEX idx_sessions_camera_created ON sessions(camera_id, created_at, session_id)")
+    conn.execute("CREATE INDEX idx_sessions_status_created ON sessions(status, created_at)")
+    conn.execute("CREATE INDEX idx_sessions_created ON sessions(created_at)")
+    conn.execute("CREATE INDEX idx_session_videos_session ON session_videos(session_id, created_at)")
+    conn.execute("CREATE INDEX idx_session_recipients_recipient ON session_recipients(recipient)")
+
+
+def _v3_revisions(conn: sqlite3.Connection):
+    """
+    Change tracking for cheap polling. Every insert/update/delete of a session
+    bumps a single global revision counter; inserted and updated rows are
+    stamped with the new value in `rev`, so clients can ask for "changes
+    since revision N" and the counter doubles as an ETag.
+    """
+    conn.execute("ALTER TABLE sessions ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE sessions ADD COLUMN updated_at TIMESTAMP")
+    conn.execute('''
+        CREATE TABLE session_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL
+        )
+    ''')
+
+    # Number existing rows in creation order
+    conn.execute('''
+        UPDATE sessions SET updated_at = created_at, rev = ordered.n
+        FROM (SELECT rowid AS row_id, ROW_NUMBER() OVER (ORDER BY created_at, session_id) AS n FROM sessions) AS ordered
+        WHERE sessions.rowid = ordered.row_id
+    ''')
+    conn.execute("INSERT INTO session_revision (id, revision) SELECT 1, COALESCE(MAX(rev), 0) FROM sessions")
+
+    conn.execute('''
+        CREATE TRIGGER sessions_rev_insert AFTER INSERT ON sessions BEGIN
+            UPDATE session_revision SET revision = revision + 1;
+            UPDATE sessions SET rev = (SELECT revision FROM session_revision), updated_at = CURRENT_TIMESTAMP
+            WHERE rowid = NEW.rowid;
+        END
+    ''')
+    # The WHEN clause skips the trigger's own stamping update
+    conn.execute('''
+        CREATE TRIGGER sessions_rev_update AFTER UPDATE ON sessions WHEN NEW.rev IS OLD.rev BEGIN
+            UPDATE session_revision SET revision = revision + 1;
+            UPDATE sessions SET rev = (SELECT revision FROM session_revision), updated_at = CURRENT_TIMESTAMP
+            WHERE rowid = NEW.rowid;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER sessions_rev_delete AFTER DELETE ON sessions BEGIN
+            UPDATE session_revision SET revision = revision + 1;
+        END
+    ''')
+
+    # Keyset pagination orders by (created_at, session_id)
+    conn.execute("DROP INDEX idx_sessions_created")
+    conn.execute("DROP INDEX idx_sessions_status_created")
+    conn.execute("CREATE INDEX idx_sessions_created ON sessions(created_at, session_id)")
+    conn.execute("CREATE INDEX idx_sessions_status_created ON sessions(status, created_at, session_id)")
+    conn.execute("CREATE INDEX idx_sessions_rev ON sessions(rev)")
+
+
+def _v4_clip_hashes(conn: sqlite3.Connection):
+    """Size and SHA-256 of each stored clip, computed while the upload is streamed to disk."""
+    conn.execute("ALTER TABLE session_videos ADD COLUMN sha256 TEXT")
+    conn.execute("ALTER TABLE session_videos ADD COLUMN size INTEGER")
+
+
+def _v5_clip_store(conn: sqlite3.Connection):
+    """
+    One row per distinct clip (by SHA-256). `ref_count` is the number of
+    session_videos rows pointing at it and is kept up to date by triggers;
+    a session's current video_path is always one of its session_videos, so
+    those rows are the only references. Clips uploaded before v4 have no hash
+    and stay outside the store.
+    """
+    conn.execute('''
+        CREATE TABLE clips (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT INTO clips (sha256, path, size, ref_count, created_at)
+        SELECT sha256, MIN(video_path), MAX(size), COUNT(*), MIN(created_at)
+        FROM session_videos WHERE sha256 IS NOT NULL GROUP BY sha256
+    ''')
+    conn.execute('''
+        CREATE TRIGGER session_videos_clip_ref AFTER INSERT ON session_videos WHEN NEW.sha256 IS NOT NULL BEGIN
+            UPDATE clips SET ref_count = ref_count + 1 WHERE sha256 = NEW.sha256;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER session_videos_clip_unref AFTER DELETE ON session_videos WHEN OLD.sha256 IS NOT NULL BEGIN
+            UPDATE clips SET ref_count = ref_count - 1 WHERE sha256 = OLD.sha256;
+        END
+    ''')
+    conn.execute("CREATE INDEX idx_session_videos_sha256 ON session_videos(sha256)")
+
+
+def _v6_outbox(conn: sqlite3.Connection):
+    """
+    Side effects of state changes (WhatsApp messages, the Firebase alarm flag)
+    are written here in the same transaction as the change and delivered by
+    the background dispatcher in outbox.py, which records the outcome per job.
+    """
+    conn.execute('''
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            session_id TEXT REFERENCES sessions(session_id),
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            delivered_at TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_outbox_due ON outbox(status, next_attempt_at)")
+    conn.execute("CREATE INDEX idx_outbox_session ON outbox(session_id)")
+
+
+def _v7_web_copies(conn: sqlite3.Connection):
+    """Browser-friendly H.264 copy and poster frame of each stored clip, filled in by the transcoder."""
+    conn.execute("ALTER TABLE clips ADD COLUMN web_path TEXT")
+    conn.execute("ALTER TABLE clips ADD COLUMN poster_path TEXT")
+    conn.execute("ALTER TABLE clips ADD COLUMN transcode_status TEXT NOT NULL DEFAULT 'pending'")
+    conn.execute("ALTER TABLE clips ADD COLUMN transcode_error TEXT")
+    # Sessions reference their current clip by path
+    conn.execute("CREATE INDEX idx_clips_path ON clips(path)")
+    conn.execute("CREATE INDEX idx_clips_transcode_status ON clips(transcode_status)")
+
+
+def _v8_clip_tiers(conn: sqlite3.Connection):
+    """'original' until the retention engine replaces the clip with a low-bitrate 'archived' copy."""
+    conn.execute("ALTER TABLE clips ADD COLUMN tier TEXT NOT NULL DEFAULT 'original'")
+    conn.execute("CREATE INDEX idx_clips_ref_count ON clips(ref_count)")
+
+
+def _v9_event_types(conn: sqlite3.Connection):
+    """Incidents are tracked per camera and event type; older rows get the type from the agent's description."""
+    conn.execute("ALTER TABLE sessions ADD COLUMN event_type TEXT NOT NULL DEFAULT 'Unknown'")
+    # "Security Alert: Fire detected!" -> "Fire"
+    conn.execute('''
+        UPDATE sessions SET event_type = substr(description, 17, length(description) - 26)
+        WHERE description LIKE 'Security Alert: % detected!'
+    ''')
+    conn.execute("CREATE INDEX idx_sessions_camera_type_created ON sessions(camera_id, event_type, created_at)")
+
+
+# Rollup key of a session row; `ref` is NEW or OLD inside a trigger
+def _rollup_key(ref: str) -> str:
+    return (f"strftime('%Y-%m-%d %H:00:00', {ref}.created_at), {ref}.camera_id, {ref}.event_type, "
+            f"COALESCE({ref}.severity, 'Unknown'), {ref}.status")
+
+
+def _v10_incident_rollups(conn: sqlite3.Connection):
+    """
+    Incident counts per hour, camera, event type, severity and status, kept
+    current by triggers on sessions so analytics never scan the sessions
+    table. A session moves between rows when its status or peak severity
+    changes. Deleting a session (retention) leaves its count in place, so
+    charts keep the history after the clips are gone.
+    """
+    conn.execute('''
+        CREATE TABLE incident_rollups (
+            hour TEXT NOT NULL,
+            camera_id TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            status TEXT NOT NULL,
+            incidents INTEGER NOT NULL,
+            PRIMARY KEY (hour, camera_id, event_type, severity, status)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'''
+        INSERT INTO incident_rollups (hour, camera_id, event_type, severity, status, incidents)
+        SELECT {_rollup_key("s")}, COUNT(*) FROM sessions s GROUP BY 1, 2, 3, 4, 5
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER sessions_rollup_insert AFTER INSERT ON sessions BEGIN
+            INSERT INTO incident_rollups (hour, camera_id, event_type, severity, status, incidents)
+            VALUES ({_rollup_key("NEW")}, 1)
+            ON CONFLICT (hour, camera_id, event_type, severity, status) DO UPDATE SET incidents = incidents + 1;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER sessions_rollup_update AFTER UPDATE OF created_at, camera_id, event_type, severity, status ON sessions
+        WHEN ({_rollup_key("OLD")}) IS NOT ({_rollup_key("NEW")}) BEGIN
+            UPDATE incident_rollups SET incidents = incidents - 1
+            WHERE (hour, camera_id, event_type, severity, status) = ({_rollup_key("OLD")});
+            DELETE FROM incident_rollups
+            WHERE (hour, camera_id, event_type, severity, status) = ({_rollup_key("OLD")}) AND incidents <= 0;
+            INSERT INTO incident_rollups (hour, camera_id, event_type, severity, status, incidents)
+            VALUES ({_rollup_key("NEW")}, 1)
+            ON CONFLICT (hour, camera_id, event_type, severity, status) DO UPDATE SET incidents = incidents + 1;
+        END
+    ''')
+
+
+# (0, 0) is what clients send when they have no location
+HAS_LOCATION = "{ref}.latitude IS NOT NULL AND {ref}.longitude IS NOT NULL AND NOT ({ref}.latitude = 0 AND {ref}.longitude = 0)"
+
+
+def index_session_locations(conn: sqlite3.Connection):
+    """
+    (Re)builds session_locations from sessions. Needed after a full VACUUM,
+    which may renumber the rowids the index is keyed by.
+    """
+    conn.execute("DELETE FROM session_locations")
+    conn.execute(f'''
+        INSERT INTO session_locations (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT s.rowid, s.latitude, s.latitude, s.longitude, s.longitude FROM sessions s
+        WHERE {HAS_LOCATION.format(ref="s")}
+    ''')
+
+
+def _v11_session_locations(conn: sqlite3.Connection):
+    """
+    R*Tree over session coordinates, keyed by sessions.rowid and kept in sync
+    by triggers, for bounding-box and nearest-incident queries. Sessions
+    without a location are left out.
+    """
+    conn.execute("CREATE VIRTUAL TABLE session_locations USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+    index_session_locations(conn)
+    conn.execute(f'''
+        CREATE TRIGGER sessions_location_insert AFTER INSERT ON sessions WHEN {HAS_LOCATION.format(ref="NEW")} BEGIN
+            INSERT INTO session_locations (id, min_lat, max_lat, min_lon, max_lon)
+            VALUES (NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER sessions_location_update AFTER UPDATE OF latitude, longitude ON sessions BEGIN
+            DELETE FROM session_locations WHERE id = OLD.rowid;
+            INSERT INTO session_locations (id, min_lat, max_lat, min_lon, max_lon)
+            SELECT NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE {HAS_LOCATION.format(ref="NEW")};
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER sessions_location_delete AFTER DELETE ON sessions BEGIN
+            DELETE FROM session_locations WHERE id = OLD.rowid;
+        END
+    ''')
+
+
+def index_session_text(conn: sqlite3.Connection):
+    """Rebuilds sessions_fts from sessions; like the location index it is keyed by rowid."""
+    conn.execute("INSERT INTO sessions_fts (sessions_fts) VALUES ('rebuild')")
+
+
+def _v12_session_search(conn: sqlite3.Connection):
+    """
+    The agent's verdict (the model's raw answer) next to the description, and
+    an FTS5 index over description, verdict and camera for /sessions/search.
+    The index reads its text from sessions (external content), so only the
+    token lists are stored twice; triggers keep it in step.
+    """
+    conn.execute("ALTER TABLE sessions ADD COLUMN verdict TEXT")
+    conn.execute('''
+        CREATE VIRTUAL TABLE sessions_fts USING fts5(
+            description, verdict, camera_id,
+            content='sessions', content_rowid='rowid', tokenize='porter unicode61'
+        )
+    ''')
+    index_session_text(conn)
+    conn.execute('''
+        CREATE TRIGGER sessions_fts_insert AFTER INSERT ON sessions BEGIN
+            INSERT INTO sessions_fts (rowid, description, verdict, camera_id)
+            VALUES (NEW.rowid, NEW.description, NEW.verdict, NEW.camera_id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER sessions_fts_update AFTER UPDATE OF description, verdict, camera_id ON sessions BEGIN
+            INSERT INTO sessions_fts (sessions_fts, rowid, description, verdict, camera_id)
+            VALUES ('delete', OLD.rowid, OLD.description, OLD.verdict, OLD.camera_id);
+            INSERT INTO sessions_fts (rowid, description, verdict, camera_id)
+            VALUES (NEW.rowid, NEW.description, NEW.verdict, NEW.camera_id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER sessions_fts_delete AFTER DELETE ON sessions BEGIN
+            INSERT INTO sessions_fts (sessions_fts, rowid, description, verdict, camera_id)
+            VALUES ('delete', OLD.rowid, OLD.description, OLD.verdict, OLD.camera_id);
+        END
+    ''')
+
+
+def _v13_session_tombstones(conn: sqlite3.Connection):
+    """
+    Deleted sessions, with the revision their deletion was given, so pollers
+    using `since=` learn about sessions retention removed. The delete trigger
+    is replaced rather than joined by a second one, so the tombstone gets the
+    bumped revision whatever order SQLite fires triggers in.
+    """
+    conn.execute('''
+        CREATE TABLE session_tombstones (
+            session_id TEXT PRIMARY KEY,
+            rev INTEGER NOT NULL,
+            deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_session_tombstones_rev ON session_tombstones(rev)")
+    conn.execute("DROP TRIGGER sessions_rev_delete")
+    conn.execute('''
+        CREATE TRIGGER sessions_rev_delete AFTER DELETE ON sessions BEGIN
+            UPDATE session_revision SET revision = revision + 1;
+            INSERT OR REPLACE INTO session_tombstones (session_id, rev)
+            VALUES (OLD.session_id, (SELECT revision FROM session_revision));
+        END
+    ''')
+
+
+def _v14_created_revisions(conn: sqlite3.Connection):
+    """
+    The revision each session was created at, so a replay of changes since
+    revision N can tell sessions created after N from ones merely updated.
+    Sessions from before this column are left at 0.
+    """
+    conn.execute("ALTER TABLE sessions ADD COLUMN created_rev INTEGER NOT NULL DEFAULT 0")
+    conn.execute("DROP TRIGGER sessions_rev_insert")
+    conn.execute('''
+        CREATE TRIGGER sessions_rev_insert AFTER INSERT ON sessions BEGIN
+            UPDATE session_revision SET revision = revision + 1;
+            UPDATE sessions SET rev = (SELECT revision FROM session_revision), created_rev = (SELECT revision FROM session_revision),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE rowid = NEW.rowid;
+        END
+    ''')
+
+
+MIGRATIONS = [
+    (1, _v1_initial),
+    (2, _v2_typed_columns),
+    (3, _v3_revisions),
+    (4, _v4_clip_hashes),
+    (5, _v5_clip_store),
+    (6, _v6_outbox),
+    (7, _v7_web_copies),
+    (8, _v8_clip_tiers),
+    (9, _v9_event_types),
+    (10, _v10_incident_rollups),
+    (11, _v11_session_locations),
+    (12, _v12_session_search),
+    (13, _v13_session_tombstones),
+    (14, _v14_created_revisions),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: int = SCHEMA_VERSION) -> int:
+    """
+    Brings the database up to `target`, one migration per transaction, and
+    returns the version it started from. Safe to call on every startup.
+    """
+    start = schema_version(conn)
+    if start > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema v{start} is newer than this service (v{SCHEMA_VERSION})")
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, migration in MIGRATIONS:
+            if version <= start or version > target:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"Migrated database to schema v{version}")
+    finally:
+        conn.isolation_level = isolation_level
+    return start
@@ -0,0 +1,36 @@
+import asyncio
+
+from db import Database
+from incidents import IncidentAggregator
+from schema import migrate
+
+
+def event(sha256, severity):
+    return {"video_path": f"{sha256}.mp4", "sha256": sha256, "size": 1, "camera_id": "cam1", "event_type": "Fire",
+            "description": "Flames", "verdict": "", "recipients": ["admin"], "latitude": "0.0", "longitude": "0.0",
+            "severity": severity, "confidence": "90%"}
+
+
+def test_same_clip_at_once_is_merged_once(tmp_path):
+    db = Database(str(tmp_path / "sessions.db"))
+    conn = db.connect()
+    migrate(conn)
+    conn.close()
+
+    async def run():
+        async def flushed(results):
+            pass
+
+        incidents = IncidentAggregator(db, str(tmp_path / "incidents.journal"), flushed, flush_interval=3600)
+        await incidents.start()
+        try:
+            first, second = await asyncio.gather(incidents.add(event("a" * 64, "Critical")),
+                                                 incidents.add(event("a" * 64, "Critical")))
+            assert sorted(str(change) for change, _ in (first, second)) == ["None", "created"]
+            incident = next(iter(incidents.active.values()))
+            assert len(incident.clips) == 1
+        finally:
+            await incidents.stop()
+            db.close()
+
+    asyncio.run(run())
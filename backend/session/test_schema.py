@@ -0,0 +1,119 @@
+import sqlite3
+
+import pytest
+
+from schema import SCHEMA_VERSION, migrate, schema_version
+
+# The tables as the service created them before migrations existed (user_version 0)
+BASELINE = [
+    '''
+    CREATE TABLE sessions (
+        session_id TEXT PRIMARY KEY,
+        video_path TEXT NOT NULL,
+        description TEXT,
+        notify_to TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        camera_id TEXT,
+        latitude TEXT,
+        longitude TEXT,
+        severity TEXT,
+        confidence TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE session_videos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        video_path TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+    )
+    ''',
+]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "baseline.db"))
+    conn.row_factory = sqlite3.Row
+    for statement in BASELINE:
+        conn.execute(statement)
+
+    # One fire incident sent to three recipients: a full copy each, with the clip recorded on every copy.
+    # The 30-minute lookup kept adding to the first copy, and only the security copy was approved.
+    for session_id, recipient, status in (("fire-admin", "admin", "pending"), ("fire-security", "security", "approved"),
+                                          ("fire-user1", "user1", "pending")):
+        conn.execute(
+            "INSERT INTO sessions VALUES (?, 'uploaded_videos/fire1.mp4', 'Security Alert: Fire detected!', ?, ?, "
+            "'2024-01-01 10:00:00', 'cam1', '12.97', '77.59', 'Critical', '85%')", (session_id, recipient, status)
+        )
+        conn.execute("INSERT INTO session_videos (session_id, video_path, created_at) "
+                     "VALUES (?, 'uploaded_videos/fire1.mp4', '2024-01-01 10:00:00')", (session_id,))
+    conn.execute("INSERT INTO session_videos (session_id, video_path, created_at) "
+                 "VALUES ('fire-admin', 'uploaded_videos/fire2.mp4', '2024-01-01 10:05:00')")
+    # A later incident on another camera, for one recipient
+    conn.execute(
+        "INSERT INTO sessions VALUES ('fight', 'uploaded_videos/fight.mp4', 'Security Alert: Violence detected!', 'admin', "
+        "'pending', '2024-01-01 11:00:00', 'cam2', 'n/a', 'n/a', 'Warning', 'Simulated (API Limit)')"
+    )
+    conn.execute("INSERT INTO session_videos (session_id, video_path, created_at) "
+                 "VALUES ('fight', 'uploaded_videos/fight.mp4', '2024-01-01 11:00:00')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_recipient_copies_are_folded(conn):
+    assert migrate(conn) == 0
+    assert schema_version(conn) == SCHEMA_VERSION
+
+    sessions = {row["session_id"]: row for row in conn.execute("SELECT * FROM sessions")}
+    assert set(sessions) == {"fire-admin", "fight"}
+    fire = sessions["fire-admin"]
+    # Highest status of any copy, typed columns, the event type from the description
+    assert fire["status"] == "approved"
+    assert (fire["latitude"], fire["longitude"]) == (12.97, 77.59)
+    assert (fire["confidence"], fire["confidence_label"]) == (85.0, "85%")
+    assert fire["event_type"] == "Fire"
+    assert sessions["fight"]["latitude"] is None
+    assert sessions["fight"]["confidence"] is None
+
+    recipients = conn.execute("SELECT recipient FROM session_recipients WHERE session_id = 'fire-admin' ORDER BY recipient")
+    assert [row[0] for row in recipients] == ["admin", "security", "user1"]
+    aliases = conn.execute("SELECT alias_id, session_id FROM session_aliases ORDER BY alias_id")
+    assert [tuple(row) for row in aliases] == [("fire-security", "fire-admin"), ("fire-user1", "fire-admin")]
+    videos = conn.execute("SELECT video_path FROM session_videos WHERE session_id = 'fire-admin' ORDER BY created_at")
+    assert [row[0] for row in videos] == ["uploaded_videos/fire1.mp4", "uploaded_videos/fire2.mp4"]
+
+
+def test_revisions_are_numbered_in_creation_order(conn):
+    migrate(conn, 3)
+    revs = conn.execute("SELECT session_id, rev FROM sessions ORDER BY rev").fetchall()
+    assert [tuple(row) for row in revs] == [("fire-admin", 1), ("fight", 2)]
+    assert conn.execute("SELECT revision FROM session_revision").fetchone()[0] == 2
+
+    # Later migrations rewrite rows through the revision triggers, keeping the counter ahead of every rev
+    migrate(conn)
+    revision = conn.execute("SELECT revision FROM session_revision").fetchone()[0]
+    assert revision == conn.execute("SELECT MAX(rev) FROM sessions").fetchone()[0]
+    conn.execute("UPDATE sessions SET status = 'rejected' WHERE session_id = 'fight'")
+    assert conn.execute("SELECT rev FROM sessions WHERE session_id = 'fight'").fetchone()[0] == revision + 1
+
+
+def test_clip_store_counts_references(conn):
+    # Clips hashed by v4 uploads, then the clip store built from them
+    migrate(conn, 4)
+    conn.execute("UPDATE session_videos SET sha256 = 'a' || video_path, size = 10")
+    conn.commit()
+    migrate(conn)
+
+    def ref_counts():
+        return dict(conn.execute("SELECT path, ref_count FROM clips").fetchall())
+
+    assert ref_counts() == {"uploaded_videos/fire1.mp4": 1, "uploaded_videos/fire2.mp4": 1, "uploaded_videos/fight.mp4": 1}
+    conn.execute("INSERT INTO session_videos (session_id, video_path, sha256, size) "
+                 "VALUES ('fight', 'uploaded_videos/fire1.mp4', 'auploaded_videos/fire1.mp4', 10)")
+    assert ref_counts()["uploaded_videos/fire1.mp4"] == 2
+    conn.execute("DELETE FROM session_videos WHERE session_id = 'fire-admin'")
+    assert ref_counts() == {"uploaded_videos/fire1.mp4": 1, "uploaded_videos/fire2.mp4": 0, "uploaded_videos/fight.mp4": 1}
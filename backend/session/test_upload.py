@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Long enough that nothing is flushed while the test runs
+os.environ["INCIDENT_FLUSH_SECONDS"] = "3600"
+os.environ["RETENTION_INTERVAL_MINUTES"] = "0"
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # The service keeps its database, journal and clips relative to the working directory,
+    # and shuts its database threads down with the app, so one app serves the whole module
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("session"))
+    # Other services' tests put their own main.py on the path too
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+    try:
+        with TestClient(main.app) as client:
+            yield client
+    finally:
+        os.chdir(cwd)
+
+
+def upload(client, data=b"same clip"):
+    return client.post("/upload", files={"file": ("clip.mp4", data, "video/mp4")},
+                       data={"description": "Fight near gate", "notify_to": "admin", "event_type": "Violence"})
+
+
+def test_same_clip_twice_before_flush(client):
+    first = upload(client)
+    assert first.status_code == 200
+    session_id = first.json()[0]["session_id"]
+
+    again = upload(client)
+    assert again.status_code == 200
+    assert again.json()[0]["session_id"] == session_id
+
+
+def test_review_before_flush(client):
+    session_id = upload(client, b"fresh clip").json()[0]["session_id"]
+    assert client.get(f"/session/{session_id}/notifications").json() == []
+
+    assert client.post(f"/session/{session_id}/approve").status_code == 200
+    assert client.get(f"/session/{session_id}").json()["status"] == "approved"
+    assert client.get("/session/unknown/notifications").status_code == 404
+
+
+def test_import_joins_unflushed_incident(client):
+    live = client.post("/upload", files={"file": ("live.mp4", b"live clip", "video/mp4")},
+                       data={"description": "Smoke", "notify_to": "admin", "camera_id": "cam7", "event_type": "Fire"})
+    session_id = live.json()[0]["session_id"]
+
+    manifest = json.dumps([{"camera_id": "cam7", "event_type": "Fire", "description": "Flames", "severity": "Critical"}])
+    imported = client.post("/import", files=[("files", ("old.mp4", b"imported clip", "video/mp4"))],
+                           data={"manifest": manifest})
+    assert imported.status_code == 200
+    assert [session["session_id"] for session in imported.json()["sessions"]] == [session_id]
+
+    # The next live clip finds the session again, with the imported clip's severity
+    again = client.post("/upload", files={"file": ("next.mp4", b"next clip", "video/mp4")},
+                        data={"description": "Smoke", "notify_to": "admin", "camera_id": "cam7", "event_type": "Fire"})
+    assert again.json()[0]["session_id"] == session_id
+    assert again.json()[0]["severity"] == "Critical"
+
+
+def test_within_returns_newest_first(client):
+    import main
+    conn = main.db.connect()
+    with conn:
+        for n in range(3):
+            conn.execute(
+                "INSERT INTO sessions (session_id, video_path, description, created_at, camera_id, latitude, longitude) "
+                "VALUES (?, 'clip.mp4', ?, ?, 'map', 12.97, 77.59)", (f"map-{n}", f"Crowd {n}", f"2024-01-0{n + 1} 10:00:00")
+            )
+    conn.close()
+
+    found = client.get("/sessions/within", params={"south": 12, "west": 77, "north": 13, "east": 78, "limit": 2}).json()
+    assert [session["session_id"] for session in found] == ["map-2", "map-1"]
+
+
+def test_clip_after_review_keeps_status(client):
+    data = {"description": "Push at exit", "notify_to": "admin", "camera_id": "cam9", "event_type": "Stampede"}
+    session_id = client.post("/upload", files={"file": ("a.mp4", b"stampede a", "video/mp4")}, data=data).json()[0]["session_id"]
+    client.post(f"/session/{session_id}/approve")
+
+    merged = client.post("/upload", files={"file": ("b.mp4", b"stampede b", "video/mp4")}, data=data).json()[0]
+    assert merged["session_id"] == session_id
+    assert merged["status"] == "approved"
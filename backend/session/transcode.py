@@ -0,0 +1,140 @@
+import asyncio
+import os
+import shutil
+from typing import Awaitable, Callable, Optional, Set
+
+
+class Transcoder:
+    """
+    Background ffmpeg workers that turn uploaded clips into browser-friendly copies.
+
+    The vision model records `mp4v` with the moov atom at the end, which many
+    browsers cannot play and none can start before the whole file arrives.
+    Each clip is re-encoded once to H.264 (yuv420p, `+faststart`) as
+    `<web_dir>/<sha256>.mp4`, and its first frame is saved as
+    `<poster_dir>/<sha256>.jpg`. Outputs are written under temporary names and
+    renamed into place, so a half-written file is never served.
+
+    At most `workers` encodes run at a time. `on_done(sha256, web_path,
+    poster_path, error)` is awaited after each clip; on failure both paths are
+    None. Without ffmpeg on PATH nothing is queued and clips are served as
+    uploaded.
+    """
+
+    def __init__(self, web_dir: str, poster_dir: str, on_done: Callable[..., Awaitable[None]],
+                 workers: int = 2, preset: str = "veryfast", crf: int = 23, max_height: int = 720):
+        self.web_dir = web_dir
+        self.poster_dir = poster_dir
+        self.on_done = on_done
+        self.workers = workers
+        self.preset = preset
+        self.crf = crf
+        self.max_height = max_height
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Set[str] = set()
+        self.tasks = []
+        if not self.ffmpeg:
+            print("Warning: ffmpeg not found on PATH. Clips will be served without transcoding.")
+        os.makedirs(web_dir, exist_ok=True)
+        os.makedirs(poster_dir, exist_ok=True)
+
+    @property
+    def available(self) -> bool:
+        return self.ffmpeg is not None
+
+    def start(self):
+        if self.available:
+            self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, sha256: str, source_path: str):
+        if not self.available or sha256 in self.pending:
+            return
+        self.pending.add(sha256)
+        self.queue.put_nowait((sha256, source_path))
+
+    def outputs(self, sha256: str):
+        return os.path.join(self.web_dir, f"{sha256}.mp4"), os.path.join(self.poster_dir, f"{sha256}.jpg")
+
+    def command(self, source_path: str, web_tmp: str, poster_tmp: str):
+        # Never upscale; even dimensions are required by yuv420p H.264
+        scale = f"scale=-2:'min({self.max_height},ih)'"
+        return [
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-i", source_path,
+            "-map", "0:v:0", "-an",
+            "-vf", scale,
+            "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            "-f", "mp4", web_tmp,
+            "-map", "0:v:0", "-frames:v", "1", "-vf", scale, "-q:v", "4",
+            "-f", "image2", poster_tmp,
+        ]
+
+    async def run(self, command, temp_paths):
+        """Runs ffmpeg, removing its temporary outputs if it fails or is cancelled."""
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+        finally:
+            if proc.returncode != 0:
+                for path in temp_paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        if proc.returncode != 0:
+            raise RuntimeError(stderr.decode(errors="replace").strip()[-500:] or f"ffmpeg exited with {proc.returncode}")
+
+    async def transcode(self, sha256: str, source_path: str):
+        web_path, poster_path = self.outputs(sha256)
+        web_tmp, poster_tmp = web_path + ".tmp", poster_path + ".tmp"
+        await self.run(self.command(source_path, web_tmp, poster_tmp), [web_tmp, poster_tmp])
+        os.replace(web_tmp, web_path)
+        os.replace(poster_tmp, poster_path)
+        return web_path, poster_path
+
+    async def downsample(self, source_path: str, dest_path: str, max_height: int, crf: int):
+        """Low-bitrate faststart H.264 copy of a clip for long-term storage."""
+        tmp = dest_path + ".tmp"
+        await self.run([
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-i", source_path,
+            "-map", "0:v:0", "-an",
+            "-vf", f"scale=-2:'min({max_height},ih)'",
+            "-c:v", "libx264", "-preset", self.preset, "-crf", str(crf),
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            "-f", "mp4", tmp,
+        ], [tmp])
+        os.replace(tmp, dest_path)
+
+    async def worker(self):
+        while True:
+            sha256, source_path = await self.queue.get()
+            error: Optional[str] = None
+            web_path = poster_path = None
+            try:
+                web_path, poster_path = await self.transcode(sha256, source_path)
+                print(f"Transcoded clip {sha256[:12]}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e)
+                print(f"Transcoding clip {sha256[:12]} failed: {error}")
+            finally:
+                self.pending.discard(sha256)
+            try:
+                await self.on_done(sha256, web_path, poster_path, error)
+            except Exception as e:
+                print(f"Error recording transcode of {sha256[:12]}: {e}")
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import UploadFile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+def _write_chunk(f, hasher, chunk: bytes):
+    # Both release the GIL for large buffers, so this runs fully off the event loop
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+async def stream_to_file(chunks: AsyncIterator[bytes], path: str, max_bytes: int,
+                         hasher=None, mode: str = "wb", already_written: int = 0) -> int:
+    """
+    Writes an async stream of chunks to `path` on a worker thread, feeding `hasher`
+    as it goes. Returns the number of bytes written. Raises UploadTooLarge (after
+    deleting a freshly created file) once the total would exceed `max_bytes`.
+    """
+    hasher = hasher if hasher is not None else hashlib.sha256()
+    written = 0
+    f = await asyncio.to_thread(open, path, mode)
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            written += len(chunk)
+            if already_written + written > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            await asyncio.to_thread(_write_chunk, f, hasher, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        if mode == "wb":
+            await asyncio.to_thread(_remove_quietly, path)
+        raise
+    await asyncio.to_thread(f.close)
+    return written
+
+
+async def iter_upload(upload: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def save_upload(upload: UploadFile, path: str, max_bytes: int) -> Tuple[int, str]:
+    """Streams a multipart upload to `path`. Returns (size, sha256 hex digest)."""
+    hasher = hashlib.sha256()
+    size = await stream_to_file(iter_upload(upload), path, max_bytes, hasher)
+    return size, hasher.hexdigest()
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _hash_file(path: str):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher
+
+
+class ResumableUploads:
+    """
+    Chunked uploads that survive dropped connections.
+
+    A client creates an upload, then PUTs the file in pieces at explicit byte
+    offsets. If the connection drops it asks for the current offset and
+    carries on from there instead of restarting. Partial data lives in
+    `<directory>/<id>.part` with a small JSON sidecar, so uploads also survive
+    a service restart; the running hash is rebuilt from the partial file when
+    needed. Abandoned uploads are removed after `expire_seconds`.
+
+    A client that sends the clip's SHA-256 up front, for a clip the service
+    already stores, gets an upload created as complete (`sha256` set in its
+    info) and can go straight to completing it without sending any bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, expire_seconds: int = 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.expire_seconds = expire_seconds
+        self.hashers: Dict[str, "hashlib._Hash"] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, upload_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, upload_id)
+        return base + ".part", base + ".json"
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        return self.locks.setdefault(upload_id, asyncio.Lock())
+
+    async def create(self, filename: str, size: Optional[int], stored_sha256: Optional[str] = None) -> dict:
+        if size is not None and size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        await asyncio.to_thread(self.expire)
+
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        info = {"upload_id": upload_id, "filename": filename, "size": size, "created_at": time.time()}
+        if stored_sha256:
+            info["sha256"] = stored_sha256
+
+        def write():
+            if not stored_sha256:
+                open(part_path, "wb").close()
+            with open(meta_path, "w") as f:
+                json.dump(info, f)
+
+        await asyncio.to_thread(write)
+        if not stored_sha256:
+            self.hashers[upload_id] = hashlib.sha256()
+        return {**info, "offset": size if stored_sha256 else 0}
+
+    async def status(self, upload_id: str) -> Optional[dict]:
+        part_path, meta_path = self._paths(upload_id)
+
+        def read():
+            if not os.path.exists(meta_path):
+                return None
+            with open(meta_path) as f:
+                info = json.load(f)
+            info["offset"] = info["size"] if info.get("sha256") else os.path.getsize(part_path)
+            return info
+
+        return await asyncio.to_thread(read)
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """Appends a chunk stream at `offset` and returns the new offset."""
+        async with self._lock(upload_id):
+            info = await self.status(upload_id)
+            if info is None:
+                raise KeyError(upload_id)
+            if offset != info["offset"] or info.get("sha256"):
+                raise OffsetMismatch(info["offset"])
+
+            part_path, _ = self._paths(upload_id)
+            hasher = self.hashers.get(upload_id)
+            if hasher is None:
+                # Service restarted mid-upload; rebuild the running hash from what we have
+                hasher = await asyncio.to_thread(_hash_file, part_path)
+                self.hashers[upload_id] = hasher
+
+            limit = min(self.max_bytes, info["size"]) if info["size"] is not None else self.max_bytes
+            try:
+                written = await stream_to_file(chunks, part_path, limit, hasher, mode="ab", already_written=offset)
+            except BaseException:
+                # A partially written chunk leaves the hash out of step with the file; rebuild it next time
+                self.hashers.pop(upload_id, None)
+                raise
+            return offset + written
+
+    async def finish(self, upload_id: str, dest_path: str) -> Tuple[dict, str]:
+        """
+        Moves a complete upload to `dest_path`. Returns (info, sha256 hex digest).
+        Uploads created for an already stored clip have no data and leave `dest_path` alone.
+        """
+        async with self._lock(upload_id):
+            info = await self.status(upload_id)
+            if info is None:
+                raise KeyError(upload_id)
+            if info["size"] is not None and info["offset"] != info["size"]:
+                raise OffsetMismatch(info["offset"])
+
+            part_path, meta_path = self._paths(upload_id)
+            if info.get("sha256"):
+                sha256 = info["sha256"]
+            else:
+                hasher = self.hashers.pop(upload_id, None) or await asyncio.to_thread(_hash_file, part_path)
+                sha256 = hasher.hexdigest()
+                await asyncio.to_thread(os.replace, part_path, dest_path)
+            await asyncio.to_thread(_remove_quietly, meta_path)
+            self.locks.pop(upload_id, None)
+            return info, sha256
+
+    async def cancel(self, upload_id: str) -> bool:
+        async with self._lock(upload_id):
+            part_path, meta_path = self._paths(upload_id)
+            existed = os.path.exists(meta_path)
+            await asyncio.to_thread(_remove_quietly, part_path)
+            await asyncio.to_thread(_remove_quietly, meta_path)
+            self.hashers.pop(upload_id, None)
+        self.locks.pop(upload_id, None)
+        return existed
+
+    def expire(self):
+        cutoff = time.time() - self.expire_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.getmtime(path) < cutoff:
+                _remove_quietly(path)
+                self.hashers.pop(name.split(".")[0], None)
@@ -0,0 +1,109 @@
+"""
+Content-addressed clip store shared by the vision model, the agent and the
+session service when they run on one host (or share a mounted volume).
+
+A clip enters the store once, from the file of whoever recorded or first
+received it, and is named `<sha256><ext>` after its content. The services
+then hand each other that clip id instead of the bytes: the agent reads frames straight
+from the stored file, and the session service hard-links it into its own
+clip directory, so the clip is neither copied nor sent over HTTP again.
+Services that are not configured with the same store keep using uploads.
+"""
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from typing import Iterable, Optional, Tuple
+
+from common.retention import prune_directory
+
+CLIP_ID_RE = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,5})$")
+CHUNK_SIZE = 1024 * 1024
+
+
+class ClipNotFound(Exception):
+    pass
+
+
+def hash_file(path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def parse_clip_id(clip_id: str) -> Tuple[str, str]:
+    """(sha256, extension) of a clip id; raises ValueError for anything else."""
+    match = CLIP_ID_RE.match(clip_id or "")
+    if not match:
+        raise ValueError(f"Invalid clip id: {clip_id!r}")
+    return match.group(1), match.group(2)
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class SharedClipStore:
+    """
+    `<directory>/<sha256><ext>` files, put in place through `<directory>/.tmp`
+    so a clip only appears under its id once it is complete. Clips come in
+    and go out as hard links where the filesystems allow, so the recorder's
+    own file, the store's and the session service's are one copy on disk,
+    and deleting any of them leaves the others intact. Stored files are never
+    modified, only added and pruned.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.temp_dir = os.path.join(self.directory, ".tmp")
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def path_for(self, clip_id: str) -> str:
+        parse_clip_id(clip_id)
+        return os.path.join(self.directory, clip_id)
+
+    def add(self, path, sha256: Optional[str] = None) -> Tuple[str, int]:
+        """
+        Stores the finished clip at `path` and returns (clip id, size). Pass
+        `sha256` if it was computed while writing; otherwise the file is
+        hashed here. A clip that is already stored is not added again.
+        """
+        ext = os.path.splitext(str(path))[1].lower()
+        if not re.match(r"^\.[a-z0-9]{1,5}$", ext):
+            ext = ".mp4"
+        clip_id = f"{sha256 or hash_file(path)}{ext}"
+        target = self.path_for(clip_id)
+        if not os.path.exists(target):
+            temp_path = os.path.join(self.temp_dir, f"{uuid.uuid4().hex}{ext}")
+            _link_or_copy(path, temp_path)
+            os.replace(temp_path, target)
+        return clip_id, os.path.getsize(path)
+
+    def locate(self, clip_id: str) -> str:
+        """Path of a stored clip; raises ClipNotFound if it is not (or no longer) there."""
+        path = self.path_for(clip_id)
+        if not os.path.isfile(path):
+            raise ClipNotFound(clip_id)
+        return path
+
+    def link_into(self, clip_id: str, target_path) -> int:
+        """Gives `target_path` the clip's content, linked or else copied, and returns its size."""
+        path = self.locate(clip_id)
+        _link_or_copy(path, target_path)
+        return os.path.getsize(target_path)
+
+    def prune(self, max_age_seconds: Optional[float] = None, max_bytes: Optional[int] = None,
+              keep: Iterable = ()) -> Tuple[int, int]:
+        """Age- and size-based pruning as for the scratch directories; see common/retention.py."""
+        return prune_directory(self.directory, max_age_seconds, max_bytes, "*.*", keep)
+
+
+def open_store(directory: Optional[str]) -> Optional[SharedClipStore]:
+    """The store at `directory` (from CLIP_STORE_DIR), or None when clips are passed as uploads."""
+    return SharedClipStore(directory) if directory else None
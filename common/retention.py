@@ -0,0 +1,51 @@
+"""
+Age- and size-based pruning for the scratch directories the model services
+write clips into (the vision model's `recordings`, the agent's
+`received_videos`). Those copies only matter until the clip has been handed
+on; the session service keeps the authoritative one.
+"""
+import os
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+
+def prune_directory(directory, max_age_seconds: Optional[float] = None, max_bytes: Optional[int] = None,
+                    pattern: str = "*", keep: Iterable = ()) -> Tuple[int, int]:
+    """
+    Deletes files matching `pattern` in `directory` that are older than
+    `max_age_seconds`, then the oldest remaining ones until the total is at
+    most `max_bytes`. Either limit may be None. Files in `keep` (e.g. clips
+    still waiting to be processed) are never deleted, though they count
+    towards the total. Returns (files deleted, bytes freed).
+    """
+    now = time.time()
+    keep = {os.path.abspath(path) for path in keep}
+    files = []
+    for path in Path(directory).glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if path.is_file():
+            files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+
+    total = sum(size for _, size, _ in files)
+    deleted = freed = 0
+    for mtime, size, path in files:
+        expired = max_age_seconds is not None and now - mtime > max_age_seconds
+        over_quota = max_bytes is not None and total > max_bytes
+        if not (expired or over_quota):
+            # Sorted oldest first: nothing newer is expired, and the quota is met
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+        freed += size
+    return deleted, freed
@@ -0,0 +1,150 @@
+"""
+Shared-memory frame ring used when the vision model and the livestream hub
+run on the same host. The vision process publishes raw BGR frames plus the
+detection metadata; the hub maps the same segment and reads the newest slot
+directly, so frames are never JPEG-encoded or sent over a socket unless a
+consumer actually needs the JPEG.
+
+Layout: a fixed header followed by `slots` equally sized slots. Each slot
+holds a small header, the metadata JSON and the raw frame bytes. The writer
+clears the slot sequence number before touching a slot and sets it last,
+so a reader that sees the same sequence before and after copying knows the
+copy is consistent.
+"""
+import json
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"CSRG"
+VERSION = 1
+# magic, version, slots, slot_size, write_seq, heartbeat
+HEADER = struct.Struct("<4sIIQQd")
+# seq, timestamp, height, width, channels, meta_len, frame_len
+SLOT_HEADER = struct.Struct("<QdIIIIQ")
+SEQ = struct.Struct("<Q")
+WRITE_SEQ_OFFSET = 4 + 4 + 4 + 8
+HEARTBEAT = struct.Struct("<d")
+HEARTBEAT_OFFSET = WRITE_SEQ_OFFSET + 8
+
+DEFAULT_SLOTS = 4
+DEFAULT_MAX_FRAME_BYTES = 1920 * 1080 * 3
+DEFAULT_MAX_META_BYTES = 256 * 1024
+
+
+def ring_name(camera_id: str) -> str:
+    return "crowdshield_" + "".join(c if c.isalnum() or c in "-_" else "_" for c in camera_id)
+
+
+class FrameRingWriter:
+    """Publisher side, owned by the vision process. Creates (and on close, removes) the segment."""
+
+    def __init__(self, camera_id: str, slots: int = DEFAULT_SLOTS,
+                 max_frame_bytes: int = DEFAULT_MAX_FRAME_BYTES, max_meta_bytes: int = DEFAULT_MAX_META_BYTES):
+        self.name = ring_name(camera_id)
+        self.slots = slots
+        self.slot_size = SLOT_HEADER.size + max_meta_bytes + max_frame_bytes
+        self.max_meta_bytes = max_meta_bytes
+        self.max_frame_bytes = max_frame_bytes
+        size = HEADER.size + slots * self.slot_size
+
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a previous run that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+
+        self.seq = 0
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, slots, self.slot_size, 0, time.time())
+
+    def publish(self, frame: np.ndarray, metadata: dict):
+        meta = json.dumps(metadata).encode()
+        if len(meta) > self.max_meta_bytes:
+            raise ValueError(f"Metadata is {len(meta)} bytes, ring allows {self.max_meta_bytes}")
+        if frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame is {frame.nbytes} bytes, ring allows {self.max_frame_bytes}")
+
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+
+        self.seq += 1
+        offset = HEADER.size + (self.seq % self.slots) * self.slot_size
+        buf = self.shm.buf
+
+        SEQ.pack_into(buf, offset, 0)
+        data_offset = offset + SLOT_HEADER.size
+        buf[data_offset:data_offset + len(meta)] = meta
+        frame_offset = data_offset + len(meta)
+        buf[frame_offset:frame_offset + frame.nbytes] = frame.reshape(-1)
+        SLOT_HEADER.pack_into(buf, offset, self.seq, time.time(), height, width, channels, len(meta), frame.nbytes)
+
+        SEQ.pack_into(buf, WRITE_SEQ_OFFSET, self.seq)
+        HEARTBEAT.pack_into(buf, HEARTBEAT_OFFSET, time.time())
+
+    def close(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FrameRingReader:
+    """Consumer side, used by the hub. Attaches to an existing segment without taking ownership of it."""
+
+    def __init__(self, camera_id: str):
+        self.name = ring_name(camera_id)
+        self.shm = shared_memory.SharedMemory(name=self.name)
+        # Attaching registers the segment with this process's resource tracker, which would
+        # unlink it when the hub exits; the writer owns its lifetime, so opt out.
+        try:
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        except Exception:
+            pass
+
+        magic, version, self.slots, self.slot_size, _, _ = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.shm.close()
+            raise ValueError(f"{self.name} is not a frame ring (version {version})")
+        self.last_seq = 0
+
+    def heartbeat(self) -> float:
+        return HEARTBEAT.unpack_from(self.shm.buf, HEARTBEAT_OFFSET)[0]
+
+    def read_latest(self) -> Optional[Tuple[int, float, np.ndarray, dict]]:
+        """
+        Returns (seq, timestamp, frame, metadata) for the newest frame if it is newer
+        than the last one returned, else None. The frame is a private copy.
+        """
+        buf = self.shm.buf
+        seq = SEQ.unpack_from(buf, WRITE_SEQ_OFFSET)[0]
+        if seq == 0 or seq == self.last_seq:
+            return None
+
+        offset = HEADER.size + (seq % self.slots) * self.slot_size
+        slot_seq, timestamp, height, width, channels, meta_len, frame_len = SLOT_HEADER.unpack_from(buf, offset)
+        if slot_seq != seq:
+            # Writer already lapped us or is mid-write; pick it up on the next poll
+            return None
+
+        data_offset = offset + SLOT_HEADER.size
+        meta = bytes(buf[data_offset:data_offset + meta_len])
+        frame_offset = data_offset + meta_len
+        frame = np.frombuffer(buf, dtype=np.uint8, count=frame_len, offset=frame_offset).copy()
+
+        if SEQ.unpack_from(buf, offset)[0] != seq:
+            return None
+
+        self.last_seq = seq
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        return seq, timestamp, frame.reshape(shape), json.loads(meta)
+
+    def close(self):
+        self.shm.close()
@@ -21,6 +21,7 @@ interface Session {
   notify_to: string;
   created_at: string;
   video_url: string;
+  poster_url?: string;
   live_url: string;
   camera_id: string;
   latitude: string;
@@ -37,14 +38,10 @@ export default function Dashboard() {
   // Poll for data
   const fetchData = async () => {
     try {
-      const res = await fetch("http://localhost:8002/sessions");
+      // Newest 4 pending sessions. The API answers unchanged polls with 304 (ETag), which the browser cache handles.
+      const res = await fetch("http://localhost:8002/sessions?status=pending&order=desc&limit=4");
       if (res.ok) {
-        const data: Session[] = await res.json();
-        // Sort by newest first
-        const sorted = data.reverse();
-
-        // Show only pending sessions, max 4
-        const pendingSessions = sorted.filter(s => s.status === 'pending').slice(0, 4);
+        const pendingSessions: Session[] = await res.json();
 
         setSessions(pendingSessions);
 
@@ -74,8 +71,15 @@ export default function Dashboard() {
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 3000); // 3s polling
-    return () => clearInterval(interval);
+    // Refresh as soon as the session service pushes a change; EventSource reconnects and resumes on its own
+    const events = new EventSource("http://localhost:8002/sessions/stream");
+    ["created", "updated", "approved", "rejected"].forEach(type => events.addEventListener(type, fetchData));
+    // Slow safety net in case the stream is blocked by a proxy
+    const interval = setInterval(fetchData, 30000);
+    return () => {
+      events.close();
+      clearInterval(interval);
+    };
   }, []);
 
   // Action Handlers
@@ -295,6 +299,7 @@ export default function Dashboard() {
             {selectedSession && selectedSession.video_url ? (
               <video
                 src={selectedSession.video_url}
+                poster={selectedSession.poster_url || undefined}
                 className="w-full h-full object-cover"
                 autoPlay loop muted playsInline
               />
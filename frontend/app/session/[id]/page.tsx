@@ -29,6 +29,7 @@ interface Session {
   notify_to: string;
   created_at: string;
   video_url: string;
+  poster_url?: string;
   live_url: string;
   camera_id: string;
   latitude: string;
@@ -239,6 +240,7 @@ export default function SessionPage() {
                     {session.video_url ? (
                       <video
                         src={session.video_url}
+                        poster={session.poster_url || undefined}
                         className="w-full h-full object-cover"
                         muted
                       />
@@ -414,6 +416,7 @@ export default function SessionPage() {
               <video
                 ref={videoRef}
                 src={currentSession.video_url}
+                poster={currentSession.poster_url || undefined}
                 className="w-full h-full object-contain"
                 autoPlay
                 loop
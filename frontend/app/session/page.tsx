@@ -29,6 +29,7 @@ interface Session {
     notify_to: string;
     created_at: string;
     video_url: string;
+    poster_url?: string;
     live_url: string;
     camera_id: string;
     latitude: string;
@@ -219,6 +220,7 @@ export default function SessionListPage() {
                                         {session.video_url ? (
                                             <video
                                                 src={session.video_url}
+                                                poster={session.poster_url || undefined}
                                                 className="w-full h-full object-cover"
                                                 muted
                                             />
@@ -385,6 +387,7 @@ export default function SessionListPage() {
                             <video
                                 ref={videoRef}
                                 src={currentSession.video_url}
+                                poster={currentSession.poster_url || undefined}
                                 className="w-full h-full object-contain"
                                 autoPlay
                                 loop
@@ -0,0 +1,189 @@
+"""
+Stand-in for the Gemini API, so the agent's rate limiting, deadlines and
+circuit breaker can be exercised without a key or quota.
+
+    python fake_gemini.py serve --port 8090 --latency 2 --rpm 10
+    GEMINI_API_ENDPOINT=http://localhost:8090 python main.py
+
+generateContent answers with a fixed classification after --latency seconds
+(plus up to --jitter), 429 RESOURCE_EXHAUSTED beyond --rpm requests a minute
+and 503 UNAVAILABLE for a --fail-rate share of requests. The behaviour can be
+changed while it runs, e.g. to simulate an outage and the recovery:
+
+    curl -X POST localhost:8090/control -d '{"fail_rate": 1}'
+    curl -X POST localhost:8090/control -d '{"fail_rate": 0, "latency": 0.5}'
+
+The burst command starts a fake in-process and fires concurrent calls at it
+through GeminiClient with the agent's settings, reporting latency per outcome:
+
+    python fake_gemini.py burst --calls 40 --clients 16 --rpm 20 --fail-rate 0.5
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Class: 1\nSeverity: Critical\nConfidence: 90%"
+
+
+class Behaviour:
+    def __init__(self, latency=1.0, jitter=0.0, rpm=0, fail_rate=0.0, reply=DEFAULT_REPLY):
+        self.latency = latency
+        self.jitter = jitter
+        self.rpm = rpm
+        self.fail_rate = fail_rate
+        self.reply = reply
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.served = defaultdict(int)
+
+    def update(self, changes: dict):
+        with self.lock:
+            for key, value in changes.items():
+                if key in ("latency", "jitter", "rpm", "fail_rate", "reply"):
+                    setattr(self, key, value)
+
+    def outcome(self) -> int:
+        """HTTP status for the next request, counting it against the per-minute limit."""
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            if self.rpm and len(self.recent) >= self.rpm:
+                status = 429
+            elif random.random() < self.fail_rate:
+                status = 503
+            else:
+                self.recent.append(now)
+                status = 200
+            self.served[status] += 1
+            return status
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    behaviour: Behaviour = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        behaviour = self.behaviour
+        self.send_json(200, {"latency": behaviour.latency, "jitter": behaviour.jitter, "rpm": behaviour.rpm,
+                             "fail_rate": behaviour.fail_rate, "served": dict(behaviour.served)})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        behaviour = self.behaviour
+        if self.path.startswith("/control"):
+            behaviour.update(json.loads(body or b"{}"))
+            return self.do_GET()
+        if ":generateContent" not in self.path:
+            return self.send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        status = behaviour.outcome()
+        if status == 429:
+            return self.send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                                                  "status": "RESOURCE_EXHAUSTED"}})
+        time.sleep(behaviour.latency + random.uniform(0, behaviour.jitter))
+        if status == 503:
+            return self.send_json(503, {"error": {"code": 503, "message": "The model is overloaded. Please try again later.",
+                                                  "status": "UNAVAILABLE"}})
+        self.send_json(200, {
+            "candidates": [{"content": {"parts": [{"text": behaviour.reply}], "role": "model"},
+                            "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": 0, "totalTokenCount": 0},
+        })
+
+
+def start(port: int, behaviour: Behaviour) -> ThreadingHTTPServer:
+    handler = type("Handler", (FakeGeminiHandler,), {"behaviour": behaviour})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def burst(args, behaviour: Behaviour):
+    import google.generativeai as genai
+    from gemini import GeminiClient, GeminiUnavailable
+
+    server = start(0, behaviour)
+    genai.configure(api_key="fake", transport="rest",
+                    client_options={"api_endpoint": f"http://127.0.0.1:{server.server_address[1]}"})
+    client = GeminiClient(requests_per_minute=args.client_rpm, burst=args.burst, max_in_flight=args.max_in_flight,
+                          timeout_seconds=args.timeout, failure_threshold=args.failure_threshold,
+                          open_seconds=args.open_seconds)
+    latencies = defaultdict(list)
+
+    def call(_):
+        start_time = time.perf_counter()
+        try:
+            client.generate(["Classify this frame."])
+            outcome = "answered"
+        except GeminiUnavailable:
+            outcome = "fallback (not called)"
+        except Exception as e:
+            outcome = f"fallback ({type(e).__name__})"
+        latencies[outcome].append(time.perf_counter() - start_time)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        for n in range(args.calls):
+            pool.submit(call, n)
+            time.sleep(args.spacing)
+    print(f"{args.calls} calls from {args.clients} clients in {time.perf_counter() - started:.1f}s")
+    for outcome, values in sorted(latencies.items()):
+        values.sort()
+        print(f"  {outcome:28} {len(values):4}  p50 {values[len(values) // 2]:6.2f}s  "
+              f"p95 {values[int(0.95 * (len(values) - 1))]:6.2f}s  max {values[-1]:6.2f}s")
+    print(json.dumps(client.stats()))
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["serve", "burst"], nargs="?", default="serve")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds before each answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds, up to this much")
+    parser.add_argument("--rpm", type=int, default=0, help="answer 429 beyond this many requests a minute (0: no limit)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    # Client settings for burst; the defaults match the agent's
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--spacing", type=float, default=0.0, help="seconds between starting calls")
+    parser.add_argument("--client-rpm", type=float, default=10)
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--failure-threshold", type=int, default=3)
+    parser.add_argument("--open-seconds", type=float, default=30)
+    args = parser.parse_args()
+
+    behaviour = Behaviour(args.latency, args.jitter, args.rpm, args.fail_rate, args.reply)
+    if args.command == "burst":
+        return burst(args, behaviour)
+    server = start(args.port, behaviour)
+    print(f"Fake Gemini listening on http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import math
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+# (frame index, seconds into the clip, BGR image)
+Sample = Tuple[int, float, np.ndarray]
+
+
+class VideoOpenError(Exception):
+    pass
+
+
+def _shrink(frame, max_width: int):
+    height, width = frame.shape[:2]
+    if width <= max_width:
+        return frame
+    return cv2.resize(frame, (max_width, round(height * max_width / width)), interpolation=cv2.INTER_AREA)
+
+
+def sample_frames(video_path, count: int = 6, max_width: int = 640) -> List[Sample]:
+    """
+    `count` frames spread evenly over the clip (the middle of each of `count`
+    equal stretches), read in one sequential pass.
+
+    Seeking with CAP_PROP_POS_FRAMES is slow and often lands on the wrong
+    frame in the vision model's mp4v files, so every frame is `grab()`bed in
+    order and only the wanted ones are `retrieve()`d. When the container
+    does not report a frame count, frames are kept at a doubling stride
+    (never more than 2 * count at once) and thinned out at the end.
+    A frame that cannot be decoded is replaced by the next one that can.
+    Frames wider than `max_width` are scaled down. Raises VideoOpenError if
+    the file cannot be opened; returns fewer frames (possibly none) if the
+    clip is shorter than it claims.
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise VideoOpenError(f"Could not open {video_path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        targets = sorted({int((i + 0.5) * total / count) for i in range(count)}) if total > 0 else None
+
+        kept = []
+        stride = 1
+        index = 0
+        # Next target to fill; a frame that fails to decode is replaced by the first one after it that does
+        position = 0
+        while cap.grab():
+            if targets is not None:
+                wanted = index >= targets[position]
+            else:
+                wanted = index % stride == 0
+            if wanted:
+                ok, frame = cap.retrieve()
+                if ok:
+                    kept.append((index, index / fps if fps else 0.0, _shrink(frame, max_width)))
+                    while targets is not None and position < len(targets) and targets[position] <= index:
+                        position += 1
+                if targets is not None and position == len(targets):
+                    break
+                if targets is None and len(kept) > 2 * count:
+                    kept = kept[::2]
+                    stride *= 2
+            index += 1
+    finally:
+        cap.release()
+
+    if targets is None and len(kept) > count:
+        step = len(kept) / count
+        kept = [kept[int((i + 0.5) * step)] for i in range(count)]
+    return kept
+
+
+def montage(samples: List[Sample], cell_width: int = 480) -> np.ndarray:
+    """
+    Tiles the samples into one image, left to right then top to bottom, each
+    labelled with its position and time, so a single request shows the
+    model how the scene develops.
+    """
+    if not samples:
+        raise ValueError("No frames to tile")
+    height, width = samples[0][2].shape[:2]
+    cell_height = round(height * cell_width / width)
+    columns = math.ceil(math.sqrt(len(samples)))
+    rows = math.ceil(len(samples) / columns)
+
+    sheet = np.zeros((rows * cell_height, columns * cell_width, 3), dtype=np.uint8)
+    for n, (_, seconds, frame) in enumerate(samples):
+        cell = cv2.resize(frame, (cell_width, cell_height), interpolation=cv2.INTER_AREA)
+        label = f"{n + 1}/{len(samples)}  t={seconds:.1f}s"
+        cv2.putText(cell, label, (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(cell, label, (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+        row, column = divmod(n, columns)
+        sheet[row * cell_height:(row + 1) * cell_height, column * cell_width:(column + 1) * cell_width] = cell
+    return sheet
@@ -0,0 +1,220 @@
+import threading
+import time
+from typing import Optional
+
+import google.generativeai as genai
+import requests
+from google.api_core import exceptions as api_exceptions
+
+
+class GeminiUnavailable(Exception):
+    """The call was not made: the breaker is open, or no slot or token freed up before the deadline."""
+
+
+class TokenBucket:
+    """
+    `rate_per_minute` tokens a minute, up to `burst` saved up for a burst of
+    clips. Callers reserve their token up front and sleep until it is due, so
+    they are served in arrival order and know at once if they would miss
+    their deadline.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, deadline: float) -> Optional[float]:
+        """
+        Takes a token and returns the seconds until it is due (0 if now), or
+        None, taking nothing, if it would not be due by `deadline`.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 and self.rate > 0 else 0.0
+            if self.tokens < 1 and (self.rate <= 0 or now + wait > deadline):
+                return None
+            # May go negative: the tokens of callers already waiting
+            self.tokens -= 1
+            return wait
+
+    def refund(self):
+        """Gives back a reserved token whose call was not made after all."""
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    def available(self) -> float:
+        with self.lock:
+            self.refill(time.monotonic())
+            return max(0.0, self.tokens)
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` failures in a row, or
+    at once when Gemini says we are over quota, it opens and callers go
+    straight to their fallback for `open_seconds`. Then a single probe call is
+    let through (half-open); its outcome closes the breaker or opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 3, open_seconds: float = 30):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+        # Set while open, so callers waiting for their turn can give up at once
+        self.tripped = threading.Event()
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = "half_open"
+                self.tripped.clear()
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            # A slow call that started before the breaker opened does not close it
+            if self.state == "open":
+                return
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+            self.tripped.clear()
+
+    def failure(self, trip: bool = False):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if trip or self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.tripped.set()
+
+    def cancel(self):
+        """The allowed call was never made; lets another caller be the half-open probe."""
+        with self.lock:
+            self.probing = False
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.state == "open"
+
+    def remaining(self) -> float:
+        with self.lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+
+class GeminiClient:
+    """
+    One Gemini model shared by every verification worker.
+
+    Each `generate` call has `timeout_seconds` in all: waiting for one of the
+    `max_in_flight` call slots, for a token from the rate limiter, and for
+    the answer itself. The SDK's own retries are switched off, so a rate-limit
+    or outage surfaces at once, trips the circuit breaker and sends the
+    following clips to the caller's fallback without waiting on the API.
+    Calls rejected after taking their token give it back, so an outage does
+    not use up the quota the first calls after it need.
+    Raises GeminiUnavailable when the call was never made, or the SDK's error
+    when it failed.
+    """
+
+    def __init__(self, model_name: str = "gemini-2.5-flash", requests_per_minute: float = 10, burst: int = 5,
+                 max_in_flight: int = 4, timeout_seconds: float = 30, failure_threshold: int = 3,
+                 open_seconds: float = 30):
+        self.model = genai.GenerativeModel(model_name)
+        self.bucket = TokenBucket(requests_per_minute, burst)
+        self.slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self.max_in_flight = max(1, max_in_flight)
+        self.timeout_seconds = timeout_seconds
+        self.breaker = CircuitBreaker(failure_threshold, open_seconds)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counts = {"calls": 0, "succeeded": 0, "failed": 0, "timed_out": 0, "rate_limited": 0,
+                       "rejected_open": 0, "rejected_busy": 0, "rejected_no_token": 0}
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def generate(self, contents) -> str:
+        deadline = time.monotonic() + self.timeout_seconds
+        if not self.breaker.allow():
+            self.count("rejected_open")
+            raise GeminiUnavailable(f"circuit open for another {self.breaker.remaining():.0f}s")
+        wait = self.bucket.reserve(deadline)
+        if wait is None:
+            self.count("rejected_no_token")
+            self.breaker.cancel()
+            raise GeminiUnavailable("rate limit reached")
+        if wait and self.breaker.tripped.wait(wait):
+            self.count("rejected_open")
+            self.bucket.refund()
+            raise GeminiUnavailable(f"circuit open for another {self.breaker.remaining():.0f}s")
+        if not self.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self.count("rejected_busy")
+            self.bucket.refund()
+            self.breaker.cancel()
+            raise GeminiUnavailable(f"{self.max_in_flight} calls already in flight")
+        try:
+            # The breaker may have opened while this call waited its turn
+            if self.breaker.is_open():
+                self.count("rejected_open")
+                self.bucket.refund()
+                raise GeminiUnavailable(f"circuit open for another {self.breaker.remaining():.0f}s")
+            with self.lock:
+                self.in_flight += 1
+                self.counts["calls"] += 1
+            try:
+                response = self.model.generate_content(
+                    contents, request_options={"timeout": max(1.0, deadline - time.monotonic()), "retry": None})
+                text = response.text.strip()
+            except api_exceptions.TooManyRequests:
+                self.count("rate_limited")
+                self.breaker.failure(trip=True)
+                raise
+            except (api_exceptions.DeadlineExceeded, requests.Timeout, TimeoutError):
+                self.count("timed_out")
+                self.breaker.failure()
+                raise
+            except Exception:
+                self.count("failed")
+                self.breaker.failure()
+                raise
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+            self.count("succeeded")
+            self.breaker.success()
+            return text
+        finally:
+            self.slots.release()
+
+    def stats(self) -> dict:
+        with self.lock:
+            counts = dict(self.counts)
+            in_flight = self.in_flight
+        return dict(counts, in_flight=in_flight, max_in_flight=self.max_in_flight,
+                    tokens=round(self.bucket.available(), 2), breaker=self.breaker.state,
+                    breaker_trips=self.breaker.trips, breaker_open_seconds=round(self.breaker.remaining(), 1))
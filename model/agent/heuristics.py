@@ -0,0 +1,96 @@
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from frames import Sample
+
+# Frames are compared at this width; enough for motion and colour, cheap on the CPU
+WORK_WIDTH = 160
+# Share of a frame's pixels that must be fire-coloured for the frame to count as showing fire
+FIRE_MIN_SHARE = 0.005
+# Mean per-pixel change between consecutive samples (0-1) treated as full activity
+MOTION_FULL = 0.06
+
+
+def _small(frame):
+    height, width = frame.shape[:2]
+    return cv2.resize(frame, (WORK_WIDTH, max(1, round(height * WORK_WIDTH / width))), interpolation=cv2.INTER_AREA)
+
+
+def fire_masks(frames) -> List[np.ndarray]:
+    """Bright, saturated red-to-yellow pixels of each frame."""
+    masks = []
+    for frame in frames:
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        masks.append(cv2.inRange(hsv, (0, 100, 180), (35, 255, 255)) > 0)
+    return masks
+
+
+def flicker(masks: List[np.ndarray]) -> float:
+    """How much the fire-coloured area changes between frames (0-1); flames move, orange walls do not."""
+    changes = []
+    for a, b in zip(masks, masks[1:]):
+        union = np.count_nonzero(a | b)
+        if union:
+            changes.append(np.count_nonzero(a ^ b) / union)
+    return float(np.median(changes)) if changes else 0.0
+
+
+def motion(frames) -> float:
+    """Median mean absolute change between consecutive frames, 0-1."""
+    greys = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+    changes = [float(cv2.absdiff(a, b).mean()) / 255 for a, b in zip(greys, greys[1:])]
+    return float(np.median(changes)) if changes else 0.0
+
+
+def score_clip(samples: List[Sample], suspected_type: str,
+               detector_confidence: Optional[float] = None) -> Optional[Tuple[float, dict]]:
+    """
+    (score, evidence) for how likely the clip shows `suspected_type`, from
+    0 (clearly not) to 1 (clearly so), or None for event types there is no
+    local check for. The score comes from the frames alone.
+
+    Fire looks for flickering fire-coloured regions across the samples,
+    Violence and Stampede for movement between them. Warm light, skin and
+    orange clothing pass the colour test and crowds always move, so a high
+    score is no confirmation; callers only use a low one, to dismiss clips
+    without fire or without movement. The vision model's `detector_confidence`
+    is only reported with the evidence.
+    """
+    frames = [_small(frame) for _, _, frame in samples]
+    if suspected_type == "Fire":
+        masks = fire_masks(frames)
+        shares = [float(mask.mean()) for mask in masks]
+        showing = sum(share >= FIRE_MIN_SHARE for share in shares) / len(shares)
+        changing = flicker(masks)
+        score = showing * (0.5 + 0.5 * min(1.0, 2 * changing))
+        details = {"fire_frames": round(showing, 2), "flicker": round(changing, 3)}
+    elif suspected_type in ("Violence", "Stampede"):
+        moving = motion(frames)
+        details = {"motion": round(moving, 4)}
+        score = min(1.0, moving / MOTION_FULL)
+    else:
+        return None
+    if detector_confidence is not None:
+        details["detector_confidence"] = round(detector_confidence, 2)
+    return round(score, 3), details
+
+
+def local_dismissal(suspected_type: str, local: Tuple[float, dict], dismiss_below: float) -> Optional[dict]:
+    """
+    The verification result for a clip whose local score is below
+    `dismiss_below`, judged Normal, or None if it has to go to Gemini. The
+    local check never confirms an incident.
+    """
+    score, evidence = local
+    if score >= dismiss_below:
+        return None
+    found = ", ".join(f"{key} {value}" for key, value in evidence.items())
+    return {
+        "event_type": "Normal",
+        "severity": "Normal",
+        "confidence": f"{round(100 * (1 - score))}%",
+        "verdict": f"Dismissed by the local check without Gemini: Normal (score {score} for {suspected_type}; {found}).",
+        "tier": "local"
+    }
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Optional
+
+# Jobs that have not finished; re-queued after a restart
+UNFINISHED = ("queued", "running")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Verification jobs for received clips, worked off by a fixed pool.
+
+    `submit` records a job and returns immediately; `workers` tasks take jobs
+    in arrival order and run `handler(job)` on a thread, since verification
+    (OpenCV decoding, the Gemini call, forwarding to the session service) is
+    blocking. Whatever the handler returns is stored as the job's `result`;
+    if it raises, the job is `failed` with the error.
+
+    Each job is kept as `<directory>/<job_id>.json` and rewritten on every
+    state change, so jobs still queued or running when the process stops are
+    queued again on the next start. Finished jobs are forgotten after
+    `keep_seconds`. At most `max_queued` jobs wait at a time; beyond that
+    `submit` raises QueueFull so callers can push back.
+    """
+
+    def __init__(self, directory: str, handler: Callable[[dict], Optional[dict]], workers: int = 4,
+                 max_queued: int = 100, keep_seconds: float = 24 * 3600):
+        self.directory = directory
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.keep_seconds = keep_seconds
+        self.jobs: Dict[str, dict] = {}
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.tasks = []
+        self.completed = 0
+        self.failed = 0
+        # (seconds waiting, seconds running) of recent jobs, for the metrics
+        self.recent = deque(maxlen=200)
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def save(self, job: dict):
+        tmp = self.path(job["job_id"]) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, self.path(job["job_id"]))
+
+    def load(self):
+        jobs = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    jobs.append(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable job file {name}: {e}")
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+    async def start(self):
+        requeued = 0
+        for job in await asyncio.to_thread(self.load):
+            self.jobs[job["job_id"]] = job
+            if job["status"] in UNFINISHED:
+                job["status"] = "queued"
+                job["started_at"] = None
+                self.queue.put_nowait(job["job_id"])
+                requeued += 1
+        if requeued:
+            print(f"Re-queued {requeued} unfinished verification job(s)")
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def submit(self, **fields) -> dict:
+        if self.depth >= self.max_queued:
+            raise QueueFull(f"{self.depth} jobs already queued")
+        job = dict(fields, job_id=uuid.uuid4().hex, status="queued", created_at=time.time(),
+                   started_at=None, finished_at=None, result=None, error=None)
+        await asyncio.to_thread(self.save, job)
+        self.jobs[job["job_id"]] = job
+        self.queue.put_nowait(job["job_id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    def pending_paths(self, field: str = "path"):
+        """Files (or other `field`, e.g. clip ids) of jobs not yet finished, which must not be cleaned up."""
+        # Called from worker threads; list() takes the snapshot in one step
+        return {job[field] for job in list(self.jobs.values()) if job["status"] in UNFINISHED and job.get(field)}
+
+    async def worker(self):
+        while True:
+            job = self.jobs.get(await self.queue.get())
+            if job is None:
+                continue
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            await asyncio.to_thread(self.save, job)
+            try:
+                job["result"] = await asyncio.to_thread(self.handler, job)
+                job["status"] = "done"
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                self.failed += 1
+                print(f"Verification job {job['job_id']} failed: {e}")
+            job["finished_at"] = time.time()
+            self.recent.append((job["started_at"] - job["created_at"], job["finished_at"] - job["started_at"]))
+            try:
+                await asyncio.to_thread(self.save, job)
+                await asyncio.to_thread(self.remove, self.expire())
+            except OSError as e:
+                print(f"Could not record job {job['job_id']}: {e}")
+
+    def expire(self):
+        """Forgets finished jobs older than keep_seconds and returns their ids."""
+        cutoff = time.time() - self.keep_seconds
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job["status"] not in UNFINISHED and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+        return expired
+
+    def remove(self, job_ids):
+        for job_id in job_ids:
+            try:
+                os.remove(self.path(job_id))
+            except FileNotFoundError:
+                pass
+
+    def metrics(self) -> dict:
+        now = time.time()
+        queued = [job for job in self.jobs.values() if job["status"] == "queued"]
+        waits = sorted(wait for wait, _ in self.recent)
+        runs = sorted(run for _, run in self.recent)
+
+        def p95(values):
+            return round(values[int(0.95 * (len(values) - 1))], 3) if values else None
+
+        return {
+            "workers": self.workers,
+            "queue_depth": len(queued),
+            "max_queued": self.max_queued,
+            "running": sum(1 for job in self.jobs.values() if job["status"] == "running"),
+            "oldest_queued_seconds": round(now - min(job["created_at"] for job in queued), 3) if queued else 0,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_seconds_p95": p95(waits),
+            "run_seconds_p95": p95(runs),
+        }
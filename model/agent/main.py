@@ -1,7 +1,16 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi.responses import JSONResponse
 import uvicorn
-import shutil
+import asyncio
+import hashlib
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Optional
 import os
 import cv2
 import google.generativeai as genai
@@ -9,6 +18,17 @@ from dotenv import load_dotenv
 from PIL import Image
 import io
 import requests
+import sys
+
+# Helpers shared between services live in the repository's `common` directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.clip_store import ClipNotFound, open_store, parse_clip_id
+from common.retention import prune_directory
+from frames import VideoOpenError, montage, sample_frames
+from gemini import GeminiClient, GeminiUnavailable
+from heuristics import local_dismissal, score_clip
+from jobs import JobQueue, QueueFull
+from verdicts import VerdictCache, dhash
 
 load_dotenv()
 
@@ -17,74 +37,155 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     print("Warning: GEMINI_API_KEY not found in environment variables.")
 
-genai.configure(api_key=GEMINI_API_KEY)
-
-app = FastAPI(title="Agent API")
+# Set to a fake_gemini.py instance (e.g. http://localhost:8090) to test without the real API
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=GEMINI_API_KEY or "fake", transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
 
 UPLOAD_DIR = Path("received_videos")
 UPLOAD_DIR.mkdir(exist_ok=True)
+JOB_DIR = Path("jobs")
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", 200)) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Received clips are forwarded to the session service, which keeps its own copy
+RECEIVED_RETENTION_HOURS = float(os.getenv("RECEIVED_RETENTION_HOURS", 24))
+RECEIVED_MAX_MB = float(os.getenv("RECEIVED_MAX_MB", 2048))
+# Clip store shared with the vision model and session service on this host; clips in it are
+# passed by id instead of uploaded. Pruned here, as the agent knows which clips are still queued.
+CLIP_STORE_DIR = os.getenv("CLIP_STORE_DIR")
+CLIP_STORE_RETENTION_HOURS = float(os.getenv("CLIP_STORE_RETENTION_HOURS", 24))
+CLIP_STORE_MAX_MB = float(os.getenv("CLIP_STORE_MAX_MB", 4096))
+# Clips verified (decode, Gemini, forward) at the same time, and how many may wait
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", 4))
+AGENT_QUEUE_MAX = int(os.getenv("AGENT_QUEUE_MAX", 100))
+# Forwarding a confirmed incident to the session service: attempts, and the first delay between them (doubling)
+FORWARD_ATTEMPTS = int(os.getenv("FORWARD_ATTEMPTS", 5))
+FORWARD_BACKOFF_SECONDS = float(os.getenv("FORWARD_BACKOFF_SECONDS", 2))
+FORWARD_BACKOFF_MAX_SECONDS = 60
+# Frames sampled per clip and tiled into the one image sent to Gemini
+AGENT_KEYFRAMES = int(os.getenv("AGENT_KEYFRAMES", 6))
+MONTAGE_CELL_WIDTH = int(os.getenv("MONTAGE_CELL_WIDTH", 480))
+# Near-identical clips from one camera reuse a recent verdict instead of calling Gemini again
+VERDICT_CACHE_TTL_SECONDS = float(os.getenv("VERDICT_CACHE_TTL_SECONDS", 300))
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", 512))
+VERDICT_CACHE_MAX_DISTANCE = int(os.getenv("VERDICT_CACHE_MAX_DISTANCE", 8))
+# Calls to Gemini: rate (with a burst allowance), calls at once, seconds per call including
+# the wait for a turn, and the circuit breaker that sends clips to the fallback during outages
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 10))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", 5))
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", 4))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", 30))
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", 3))
+GEMINI_BREAKER_OPEN_SECONDS = float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", 30))
+# Local check first: clips scoring below this (0-1) are judged Normal without Gemini; 0 sends every clip to Gemini
+LOCAL_DISMISS_BELOW = float(os.getenv("LOCAL_DISMISS_BELOW", 0.15))
+
+clip_store = open_store(CLIP_STORE_DIR)
+verdict_cache = VerdictCache(VERDICT_CACHE_TTL_SECONDS, VERDICT_CACHE_SIZE, VERDICT_CACHE_MAX_DISTANCE)
+gemini = GeminiClient(GEMINI_MODEL, GEMINI_RPM, GEMINI_BURST, GEMINI_MAX_IN_FLIGHT, GEMINI_TIMEOUT_SECONDS,
+                      GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_OPEN_SECONDS)
+
+# Seconds taken by recent verifications, per tier that decided them (local, cache, gemini, fallback, error)
+tier_lock = threading.Lock()
+tier_seconds = defaultdict(lambda: deque(maxlen=200))
+tier_counts = defaultdict(int)
+
+def record_tier(tier: str, seconds: float):
+    with tier_lock:
+        tier_counts[tier] += 1
+        tier_seconds[tier].append(seconds)
+
+def tier_metrics():
+    with tier_lock:
+        return {tier: {"clips": tier_counts[tier], "median_seconds": round(statistics.median(tier_seconds[tier]), 3)}
+                for tier in tier_counts}
 
-def process_video_with_gemini(video_path: Path, suspected_type: str = "Violence"):
+def write_chunk(buffer, hasher, chunk):
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+async def save_upload(file: UploadFile, file_path: Path):
     """
-    Extracts a frame from the video and asks Gemini if a person is present.
+    Streams the upload to disk in chunks on a worker thread, so the event loop keeps
+    serving other cameras. Returns (size, sha256 hex digest); raises 413 over MAX_UPLOAD_MB.
     """
-    # ... (code omitted for brevity, logic remains, only fallback changes)
-    
-    # We need to preserve the middle logic, but replace the Exception block. 
-    # Since replace_file_content requires exact match, I will target the Def line and the Exception block separately if needed, 
-    # OR replace the whole function if small enough. It's 67 lines. 
-    # Let's try replacing the SIGNATURE first, then the FALLBACK.
-    
-    # Actually, I'll do it in one go for the signature, but I need to be careful with the body content not matching.
-    # The previous tool call view showed the content.
-    pass
-
-# Retrying with correct strategy: 
-# 1. Update signature
-# 2. Update Fallback
+    hasher = hashlib.sha256()
+    size = 0
+    buffer = await asyncio.to_thread(file_path.open, "wb")
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+            await asyncio.to_thread(write_chunk, buffer, hasher, chunk)
+    except BaseException:
+        await asyncio.to_thread(buffer.close)
+        file_path.unlink(missing_ok=True)
+        raise
+    await asyncio.to_thread(buffer.close)
+    return size, hasher.hexdigest()
 
+def process_video_with_gemini(video_path: Path, suspected_type: str = "Violence", camera_id: str = None,
+                              detector_confidence: float = None):
     """
-    Extracts a frame from the video and asks Gemini if a person is present.
+    Samples AGENT_KEYFRAMES frames across the clip and decides in tiers, recorded as
+    the result's `tier`: a local check of the frames dismisses clear negatives, a recent
+    verdict for a near-identical clip is reused, and only the rest go to Gemini as a
+    single montage, so the verdict sees how the scene develops.
     """
     print(f"Processing video: {video_path}")
-    cap = cv2.VideoCapture(str(video_path))
-    if not cap.isOpened():
+    try:
+        samples = sample_frames(video_path, AGENT_KEYFRAMES)
+    except VideoOpenError:
         print("Error opening video file")
         return {
             "event_type": suspected_type,
             "severity": "Recall",
-            "confidence": "Video Error"
+            "confidence": "Video Error",
+            "verdict": "Not verified: the clip could not be opened.",
+            "tier": "error"
         }
 
-    # Get total frames and pick a middle frame to ensure we see the scene
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    middle_frame_index = max(0, total_frames // 2)
-    cap.set(cv2.CAP_PROP_POS_FRAMES, middle_frame_index)
-    
-    ret, frame = cap.read()
-    cap.release()
-    
-    if not ret:
+    if not samples:
         print("Error reading frame from video")
         return {
             "event_type": suspected_type,
             "severity": "Recall",
-            "confidence": "Frame Error"
+            "confidence": "Frame Error",
+            "verdict": "Not verified: no frame could be read from the clip.",
+            "tier": "error"
         }
 
+    local = score_clip(samples, suspected_type, detector_confidence)
+    if local:
+        found = ", ".join(f"{key} {value}" for key, value in local[1].items())
+        dismissed = local_dismissal(suspected_type, local, LOCAL_DISMISS_BELOW)
+        if dismissed:
+            print(f"Local check dismissed {suspected_type} clip (score {local[0]}; {found})")
+            return dismissed
+        print(f"Local check cannot dismiss {suspected_type} clip (score {local[0]}; {found}), asking Gemini")
+
+    hashes = [dhash(frame) for _, _, frame in samples]
+    if camera_id is not None:
+        cached = verdict_cache.lookup(camera_id, hashes)
+        if cached:
+            verdict, distance = cached
+            print(f"Reusing recent verdict for {camera_id} (frames {distance} bits apart): {verdict['event_type']}")
+            return dict(verdict, cached=True, tier="cache")
+
     # Convert BGR (OpenCV) to RGB (PIL)
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    rgb_frame = cv2.cvtColor(montage(samples, MONTAGE_CELL_WIDTH), cv2.COLOR_BGR2RGB)
     pil_image = Image.fromarray(rgb_frame)
 
     try:
-        print("Sending frame to Gemini for validation...")
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content([
-            "Analyze this image for safety. Classify it as one of the following:\n0 - Fire\n1 - Violence\n2 - Normal/Safe\n3 - Stampede\nAlso provide a Severity (Critical/Warning/Informational) and a Confidence score (0-100%).\nReturn the response in this format:\nClass: [0/1/2/3]\nSeverity: [Severity]\nConfidence: [Score%]",
+        print(f"Sending {len(samples)}-frame montage to Gemini for validation...")
+        content = gemini.generate([
+            f"This image shows {len(samples)} frames from a security camera clip in time order, left to right and top to bottom, each labelled with its time. Analyze the scene across the frames for safety. Classify it as one of the following:\n0 - Fire\n1 - Violence\n2 - Normal/Safe\n3 - Stampede\nAlso provide a Severity (Critical/Warning/Informational) and a Confidence score (0-100%).\nReturn the response in this format:\nClass: [0/1/2/3]\nSeverity: [Severity]\nConfidence: [Score%]",
             pil_image
         ])
-        
-        content = response.text.strip()
         print(f"Gemini response: {content}")
         
         # Parse response
@@ -104,25 +205,42 @@ def process_video_with_gemini(video_path: Path, suspected_type: str = "Violence"
             if "Confidence:" in line:
                 confidence = line.split("Confidence:")[1].strip()
         
-        return {
+        result = {
             "event_type": event_type,
             "severity": severity,
-            "confidence": confidence
+            "confidence": confidence,
+            "verdict": content,
+            "tier": "gemini"
         }
+        # Only real answers are cached; the fallbacks below should be retried next time
+        if camera_id is not None:
+            verdict_cache.store(camera_id, hashes, result)
+        return result
 
     except Exception as e:
-        print(f"Gemini error: {e}")
+        # GeminiUnavailable: rate limited or circuit open, so no call was made at all
+        print(f"Gemini {'skipped' if isinstance(e, GeminiUnavailable) else 'error'}: {e}")
         print(f"WARNING: Using dummy data ({suspected_type}) for session due to API error/limits.")
         # Fallback to dummy data as requested
         return {
             "event_type": suspected_type,
             "severity": "Critical",
-            "confidence": "Simulated (API Limit)"
+            "confidence": "Simulated (API Limit)",
+            "verdict": f"Not verified ({e}); assumed {suspected_type} as reported by the vision model"
+                       + (f" (local check score {local[0]})." if local else "."),
+            "tier": "fallback"
         }
 
-def handle_event(video_path: Path, event_data: dict, camera_id: str, latitude: str, longitude: str):
+def handle_event(video_path: Path, event_data: dict, camera_id: str, latitude: str, longitude: str,
+                 filename: str = None, clip_id: str = None):
     """
-    Sends the video to the Crowd Shield API to create a session for the event.
+    Sends the video to the Crowd Shield API to create a session for the event: by `clip_id`
+    when the clip is in the shared store, uploading the file if the service cannot find it there.
+    Returns the session service's response; raises if the clip could not be delivered.
+
+    Timeouts, connection errors, 429 and 5xx answers are retried up to FORWARD_ATTEMPTS
+    times with doubling delays; the session service ignores a clip it already has, so a
+    retry after a lost answer does not duplicate it. Other 4xx answers fail at once.
     """
     event_type = event_data['event_type']
     severity = event_data['severity']
@@ -133,61 +251,179 @@ def handle_event(video_path: Path, event_data: dict, camera_id: str, latitude: s
     
     description = f"Security Alert: {event_type} detected!"
     
-    try:
-        with open(video_path, 'rb') as f:
-            files = {'file': (video_path.name, f, 'video/mp4')}
-            data = {
-                'description': description,
-                'notify_to': 'admin,security',
-                'camera_id': camera_id,
-                'latitude': latitude,
-                'longitude': longitude,
-                'severity': severity,
-                'confidence': confidence
-            }
-            response = requests.post(crowd_shield_url, files=files, data=data)
-            
+    data = {
+        'description': description,
+        'notify_to': 'admin,security',
+        'camera_id': camera_id,
+        'event_type': event_type,
+        'latitude': latitude,
+        'longitude': longitude,
+        'severity': severity,
+        'confidence': confidence,
+        'verdict': event_data.get('verdict', '')
+    }
+    for attempt in range(1, FORWARD_ATTEMPTS + 1):
+        try:
+            response = post_event(crowd_shield_url, data, video_path, filename, clip_id)
+        except requests.RequestException as e:
+            print(f"Error sending to Crowd Shield API: {e}")
+            error = str(e)
+        else:
             if response.status_code == 200:
                 print(f"Successfully created session: {response.json()}")
-            else:
-                print(f"Failed to create session. Status: {response.status_code}, Response: {response.text}")
-                
-    except Exception as e:
-        print(f"Error sending to Crowd Shield API: {e}")
+                return response.json()
+            print(f"Failed to create session. Status: {response.status_code}, Response: {response.text}")
+            error = f"Session service returned {response.status_code}: {response.text[:200]}"
+            if response.status_code < 500 and response.status_code != 429:
+                raise RuntimeError(error)
+        if attempt < FORWARD_ATTEMPTS:
+            delay = min(FORWARD_BACKOFF_MAX_SECONDS, FORWARD_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            print(f"Retrying in {delay:.0f}s (attempt {attempt} of {FORWARD_ATTEMPTS})")
+            time.sleep(delay)
+    raise RuntimeError(f"Gave up after {FORWARD_ATTEMPTS} attempts: {error}")
 
-@app.post("/agent")
+def post_event(crowd_shield_url, data, video_path: Path, filename: str = None, clip_id: str = None):
+    """One delivery attempt: by clip id if there is one, falling back to uploading the file."""
+    if clip_id:
+        response = requests.post(crowd_shield_url, data=dict(data, clip_id=clip_id), timeout=120)
+        if response.status_code not in (400, 404, 422):
+            return response
+        # Not sharing this store, or the clip was pruned from it: send the bytes instead
+        print(f"Session service could not take clip {clip_id[:12]} by id ({response.status_code}), uploading it")
+    with open(video_path, 'rb') as f:
+        files = {'file': (filename or video_path.name, f, 'video/mp4')}
+        return requests.post(crowd_shield_url, files=files, data=data, timeout=120)
+
+def verify_clip(job: dict):
+    """Runs on a job worker thread: verifies the clip and forwards real incidents."""
+    file_path = Path(job["path"])
+    started = time.perf_counter()
+    result = process_video_with_gemini(file_path, suspected_type=job["event_type"], camera_id=job["camera_id"],
+                                       detector_confidence=job.get("detector_confidence"))
+    record_tier(result["tier"], time.perf_counter() - started)
+    event_result = result['event_type']
+
+    sessions = None
+    if event_result == "Fire" or event_result == "Violence" or event_result == "Stampede":
+        sessions = handle_event(file_path, result, job["camera_id"], job["latitude"], job["longitude"], job["filename"],
+                                job.get("clip_id"))
+    else:
+        print(f"Event judged as {event_result} (Safe/Normal). No action taken.")
+
+    deleted, freed = prune_directory(UPLOAD_DIR, RECEIVED_RETENTION_HOURS * 3600, int(RECEIVED_MAX_MB * 1024 * 1024),
+                                     keep=jobs.pending_paths() - {job["path"]})
+    if deleted:
+        print(f"Pruned {deleted} old received clip(s), {freed / 1e6:.1f} MB")
+    if clip_store:
+        queued = {clip_store.path_for(clip_id) for clip_id in jobs.pending_paths("clip_id") - {job.get("clip_id")}}
+        deleted, freed = clip_store.prune(CLIP_STORE_RETENTION_HOURS * 3600, int(CLIP_STORE_MAX_MB * 1024 * 1024), keep=queued)
+        if deleted:
+            print(f"Pruned {deleted} old clip(s) from the shared store, {freed / 1e6:.1f} MB")
+
+    return {
+        "event_detected": event_result,
+        "details": result,
+        "session_ids": [session["session_id"] for session in sessions or []],
+    }
+
+jobs = JobQueue(str(JOB_DIR), verify_clip, workers=AGENT_WORKERS, max_queued=AGENT_QUEUE_MAX,
+                keep_seconds=RECEIVED_RETENTION_HOURS * 3600)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await jobs.start()
+    yield
+    await jobs.stop()
+
+app = FastAPI(title="Agent API", lifespan=lifespan)
+
+@app.post("/agent", status_code=202)
 async def agent_endpoint(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    clip_id: Optional[str] = Form(None),
+    filename: Optional[str] = Form(None),
     camera_id: str = Form("cam1"),
     latitude: str = Form("0.0"),
     longitude: str = Form("0.0"),
-    event_type: str = Form("Unknown")
+    event_type: str = Form("Unknown"),
+    detector_confidence: Optional[float] = Form(None)
 ):
+    """
+    Stores the clip and queues it for verification, returning 202 with a job id right away;
+    poll /jobs/{job_id} for the outcome. Answers 503 with Retry-After while AGENT_QUEUE_MAX
+    clips are already waiting. `detector_confidence` is the vision model's score (0-1) for
+    the suspected event; it is recorded with the local check's evidence.
+
+    Either upload the clip as `file`, or pass the `clip_id` (and original `filename`) of a clip
+    already in the shared store (CLIP_STORE_DIR), which is then read in place; 404 means the
+    clip is not available here and should be uploaded. Uploaded clips are added to the store
+    so they can be handed on to the session service by id.
+    """
+    if jobs.depth >= jobs.max_queued:
+        return JSONResponse(status_code=503, content={"detail": "Verification queue is full"}, headers={"Retry-After": "10"})
     try:
-        file_path = UPLOAD_DIR / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"Received video: {file.filename} from {camera_id} at {latitude},{longitude}. Suspected: {event_type}")
-        
-        # Analyze video with Gemini
-        result = process_video_with_gemini(file_path, suspected_type=event_type)
-        event_result = result['event_type']
-        
-        if event_result == "Fire" or event_result == "Violence" or event_result == "Stampede":
-            handle_event(file_path, result, camera_id, latitude, longitude)
+        if clip_id:
+            if clip_store is None:
+                raise HTTPException(status_code=404, detail="No shared clip store configured")
+            try:
+                sha256, _ = parse_clip_id(clip_id)
+                file_path = Path(clip_store.locate(clip_id))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except ClipNotFound:
+                raise HTTPException(status_code=404, detail=f"Clip {clip_id} is not in the shared store")
+            size = file_path.stat().st_size
+            filename = Path(filename or clip_id).name
+            print(f"Received clip {clip_id[:12]} ({filename}, {size} bytes) by reference from {camera_id} at {latitude},{longitude}. Suspected: {event_type}")
+        elif file is not None:
+            filename = Path(file.filename).name
+            # Prefixed so clips with the same name from different cameras never overwrite each other
+            file_path = UPLOAD_DIR / f"{uuid.uuid4().hex[:8]}_{filename}"
+            size, sha256 = await save_upload(file, file_path)
+            if clip_store:
+                clip_id, _ = await asyncio.to_thread(clip_store.add, file_path, sha256)
+
+            print(f"Received video: {filename} ({size} bytes, sha256 {sha256[:12]}) from {camera_id} at {latitude},{longitude}. Suspected: {event_type}")
         else:
-            print(f"Event judged as {event_result} (Safe/Normal). No action taken.")
-        
+            raise HTTPException(status_code=400, detail="Send the clip as file or clip_id")
+
+        try:
+            job = await jobs.submit(path=str(file_path), filename=filename, size=size, sha256=sha256, camera_id=camera_id,
+                                    latitude=latitude, longitude=longitude, event_type=event_type,
+                                    detector_confidence=detector_confidence, clip_id=clip_id)
+        except QueueFull:
+            if file is not None:
+                file_path.unlink(missing_ok=True)
+            return JSONResponse(status_code=503, content={"detail": "Verification queue is full"}, headers={"Retry-After": "10"})
+
         return {
-            "filename": file.filename, 
-            "status": "processed", 
-            "event_detected": event_result,
-            "details": result
+            "filename": filename,
+            "status": "queued",
+            "job_id": job["job_id"],
+            "status_url": f"/jobs/{job['job_id']}",
+            "queue_depth": jobs.depth,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status of a verification job: queued, running, done (with its result) or failed (with the error)."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {key: value for key, value in job.items() if key != "path"}
+
+@app.get("/metrics")
+def metrics():
+    """
+    Queue depth, busy workers, throughput counters, recent wait/run times, clips decided and
+    median verification time per tier, verdict cache hits and Gemini call outcomes.
+    """
+    return dict(jobs.metrics(), tiers=tier_metrics(), verdict_cache=verdict_cache.stats(), gemini=gemini.stats())
+
 @app.get("/")
 def root():
     return {"status": "Agent is running"}
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+
+import frames
+
+
+class FakeCapture:
+    """A clip of `total` frames whose pixels hold the frame index; frames in `broken` fail to decode."""
+
+    def __init__(self, total, broken=()):
+        self.total = total
+        self.broken = set(broken)
+        self.index = -1
+
+    def __call__(self, path):
+        return self
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FPS: 10.0, cv2.CAP_PROP_FRAME_COUNT: float(self.total)}.get(prop, 0.0)
+
+    def grab(self):
+        self.index += 1
+        return self.index < self.total
+
+    def retrieve(self):
+        if self.index in self.broken:
+            return False, None
+        return True, np.full((4, 4, 3), self.index, dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+def test_even_samples(monkeypatch):
+    monkeypatch.setattr(frames.cv2, "VideoCapture", FakeCapture(60))
+    assert [index for index, _, _ in frames.sample_frames("clip.mp4", count=6)] == [5, 15, 25, 35, 45, 55]
+
+
+def test_undecodable_frame_is_replaced_by_the_next(monkeypatch):
+    monkeypatch.setattr(frames.cv2, "VideoCapture", FakeCapture(60, broken={15, 16}))
+    samples = frames.sample_frames("clip.mp4", count=6)
+    assert [index for index, _, _ in samples] == [5, 17, 25, 35, 45, 55]
+    assert samples[1][2][0, 0, 0] == 17
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from gemini import CircuitBreaker, GeminiClient, GeminiUnavailable, TokenBucket
+
+
+def test_bucket_serves_burst_then_waits():
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    deadline = time.monotonic() + 10
+    assert bucket.reserve(deadline) == 0
+    assert bucket.reserve(deadline) == 0
+    # Third token is due in about a second at one a second
+    assert 0.9 < bucket.reserve(deadline) <= 1.0
+    assert bucket.reserve(time.monotonic() + 0.5) is None
+
+
+def test_bucket_refund():
+    bucket = TokenBucket(rate_per_minute=0.001, burst=1)
+    assert bucket.reserve(time.monotonic() + 1) == 0
+    assert bucket.reserve(time.monotonic() + 1) is None
+    bucket.refund()
+    assert bucket.reserve(time.monotonic() + 1) == 0
+
+
+def test_breaker_opens_after_failures_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, open_seconds=0.05)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_reopens_and_quota_error_trips_at_once():
+    breaker = CircuitBreaker(failure_threshold=5, open_seconds=0.05)
+    breaker.failure(trip=True)
+    assert breaker.state == "open" and breaker.trips == 1
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and breaker.trips == 2
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, request_options=None):
+        self.calls += 1
+        return type("Response", (), {"text": " Class: 0 "})()
+
+
+def client(**settings):
+    gemini = GeminiClient(**settings)
+    gemini.model = FakeModel()
+    return gemini
+
+
+def test_generate_answers():
+    gemini = client()
+    assert gemini.generate(["frame"]) == "Class: 0"
+    assert gemini.stats()["succeeded"] == 1
+
+
+def test_busy_rejection_returns_its_token():
+    gemini = client(requests_per_minute=0.001, burst=1, max_in_flight=1, timeout_seconds=0.1)
+    gemini.slots.acquire()
+    with pytest.raises(GeminiUnavailable):
+        gemini.generate(["frame"])
+    gemini.slots.release()
+    assert gemini.stats()["rejected_busy"] == 1
+    # The token the rejected call took is back for the next one
+    assert gemini.generate(["frame"]) == "Class: 0"
+
+
+def test_rejection_while_waiting_for_token_returns_it():
+    gemini = client(requests_per_minute=60, burst=1, timeout_seconds=5)
+    gemini.generate(["frame"])
+    tokens = gemini.bucket.available()
+
+    threading.Timer(0.1, lambda: gemini.breaker.failure(trip=True)).start()
+    with pytest.raises(GeminiUnavailable):
+        gemini.generate(["frame"])
+    assert gemini.model.calls == 1
+    assert gemini.bucket.available() >= tokens
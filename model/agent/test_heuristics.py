@@ -0,0 +1,44 @@
+import numpy as np
+
+from heuristics import local_dismissal, score_clip
+
+# The agent's default LOCAL_DISMISS_BELOW
+DISMISS_BELOW = 0.15
+
+
+def samples(frames):
+    return [(n, n / 10, frame) for n, frame in enumerate(frames)]
+
+
+def warm_crowd(count=6):
+    """Orange-lit people in orange jackets walking across a dim square."""
+    rng = np.random.default_rng(1)
+    frames = []
+    for n in range(count):
+        frame = np.full((120, 160, 3), (40, 60, 90), dtype=np.uint8)
+        for x, y in rng.integers(0, 140, (12, 2)):
+            x = (x + 7 * n) % 140
+            frame[y % 100:y % 100 + 20, x:x + 12] = (30, 140, 250)
+        frames.append(frame)
+    return samples(frames)
+
+
+def test_confident_detection_on_busy_scene_goes_to_gemini():
+    rng = np.random.default_rng(0)
+    busy = samples(rng.integers(0, 256, (6, 120, 160, 3), dtype=np.uint8))
+    local = score_clip(busy, "Violence", detector_confidence=0.95)
+    assert local[1]["detector_confidence"] == 0.95
+    assert local_dismissal("Violence", local, DISMISS_BELOW) is None
+
+
+def test_warm_toned_crowd_is_never_confirmed_locally():
+    local = score_clip(warm_crowd(), "Fire", detector_confidence=0.9)
+    # The colour mask matches, so the clip is not dismissed either: Gemini decides
+    assert local[0] > 0.5
+    assert local_dismissal("Fire", local, DISMISS_BELOW) is None
+
+
+def test_still_scene_is_dismissed():
+    still = samples([np.full((120, 160, 3), 90, dtype=np.uint8)] * 6)
+    result = local_dismissal("Stampede", score_clip(still, "Stampede", detector_confidence=0.8), DISMISS_BELOW)
+    assert result["event_type"] == "Normal" and result["tier"] == "local"
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+import cv2
+
+HASH_BITS = 64
+
+
+def dhash(frame) -> int:
+    """
+    64-bit difference hash of a BGR frame: shrink to 9x8 greyscale and record
+    whether each pixel is brighter than its right neighbour. Re-encoding,
+    small shifts and noise flip few bits; a different scene flips many.
+    """
+    grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(grey, (9, 8), interpolation=cv2.INTER_AREA)
+    value = 0
+    for row in small:
+        for left, right in zip(row[:-1], row[1:]):
+            value = (value << 1) | int(left > right)
+    return value
+
+
+def distance(a: Sequence[int], b: Sequence[int]) -> int:
+    """Largest Hamming distance between corresponding frame hashes; clips of different lengths never match."""
+    if len(a) != len(b) or not a:
+        return HASH_BITS + 1
+    return max(bin(x ^ y).count("1") for x, y in zip(a, b))
+
+
+class VerdictCache:
+    """
+    Recent Gemini verdicts per camera, keyed by the perceptual hashes of the
+    frames that were sent.
+
+    A clip whose frames all lie within `max_distance` bits of a cached clip
+    from the same camera gets that clip's verdict instead of a new API call,
+    as long as the verdict is younger than `ttl_seconds`, so a long incident
+    is still re-checked every TTL. At most `max_entries` verdicts are kept,
+    least recently used first out. Safe to use from the job worker threads.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_entries: int = 512, max_distance: int = 8):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.entries: "OrderedDict[Tuple[str, Tuple[int, ...]], Tuple[dict, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def lookup(self, camera_id: str, hashes: Sequence[int]) -> Optional[Tuple[dict, int]]:
+        """(verdict, distance) of the closest fresh match, or None."""
+        if not self.enabled:
+            return None
+        hashes = tuple(hashes)
+        now = time.time()
+        with self.lock:
+            best = None
+            for key, (verdict, stored_at) in list(self.entries.items()):
+                if now - stored_at > self.ttl_seconds:
+                    del self.entries[key]
+                    continue
+                if key[0] != camera_id:
+                    continue
+                d = distance(key[1], hashes)
+                if d <= self.max_distance and (best is None or d < best[2]):
+                    best = (key, verdict, d)
+            if best is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(best[0])
+            self.hits += 1
+            return dict(best[1]), best[2]
+
+    def store(self, camera_id: str, hashes: Sequence[int], verdict: dict):
+        if not self.enabled:
+            return
+        with self.lock:
+            key = (camera_id, tuple(hashes))
+            self.entries[key] = (dict(verdict), time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+            }
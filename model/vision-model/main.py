@@ -3,6 +3,7 @@ import sys
 import os
 import time
 import asyncio
+import json
 import threading
 import requests
 import numpy as np
@@ -25,6 +26,12 @@ except ImportError as e:
     print("Ensure you are running from 'model/vision-model/' or that the directories 'fight_detection' and 'fire_detection' are accessible.")
     sys.exit(1)
 
+# Modules shared with the livestream hub live in the repository's `common` directory
+sys.path.append(os.path.join(current_dir, "..", ".."))
+from common.clip_store import open_store
+from common.retention import prune_directory
+from common.shm_ring import FrameRingWriter
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -33,6 +40,14 @@ load_dotenv()
 CAMERA_ID = os.getenv("CAMERA_ID", "cam1")
 LIVESTREAM_URL = os.getenv("LIVESTREAM_URL", "ws://localhost:8000/ws/push/cam1")
 AGENT_URL = os.getenv("AGENT_URL", "http://localhost:8001/agent")
+# Publish raw frames to the hub over shared memory instead of the websocket.
+# Only works when the hub runs on this machine with this camera in SHM_INGEST_CAMERAS.
+SHM_INGEST = os.getenv("SHM_INGEST", "0") == "1"
+# Local clip copies are only needed until the agent has them
+RECORDINGS_RETENTION_HOURS = float(os.getenv("RECORDINGS_RETENTION_HOURS", 24))
+RECORDINGS_MAX_MB = float(os.getenv("RECORDINGS_MAX_MB", 2048))
+# Clip store shared with the agent on this host: clips are handed over by id instead of uploaded
+CLIP_STORE_DIR = os.getenv("CLIP_STORE_DIR")
 BUFFER_SECONDS = 10
 STAMPEDE_THRESHOLD = 5 # Number of people to trigger a stampede alert
 FPS = 15
@@ -69,6 +84,7 @@ class VisionSystem:
         # Create recordings directory
         self.rec_dir = Path("recordings")
         self.rec_dir.mkdir(parents=True, exist_ok=True)
+        self.clip_store = open_store(CLIP_STORE_DIR)
         self.latest_frame = None
         self.frame_lock = threading.Lock()
         
@@ -96,25 +112,44 @@ class VisionSystem:
             # Maintain approximate FPS
             time.sleep(1.0 / FPS)
 
-    def upload_event_worker(self, video_path, event_type):
-        """Thread worker to upload video to agent."""
+    def upload_event_worker(self, video_path, event_type, confidence):
+        """Thread worker to hand the clip to the agent: by id through the shared clip store if possible, else uploaded."""
         try:
-            print(f"Uploading {video_path} to Agent...")
-            with open(video_path, 'rb') as f:
-                files = {'file': (video_path.name, f, 'video/mp4')}
-                data = {
-                    'camera_id': CAMERA_ID,
-                    'latitude': LATITUDE,
-                    'longitude': LONGITUDE,
-                    'event_type': event_type
-                }
-                # Timeout to prevent hanging
-                requests.post(AGENT_URL, files=files, data=data, timeout=30)
-            print(f"Successfully sent {event_type} event to Agent.")
+            data = {
+                'camera_id': CAMERA_ID,
+                'latitude': LATITUDE,
+                'longitude': LONGITUDE,
+                'event_type': event_type,
+                'detector_confidence': f"{confidence:.3f}"
+            }
+            response = None
+            if self.clip_store:
+                clip_id, _ = self.clip_store.add(video_path)
+                print(f"Handing {video_path} to Agent as clip {clip_id[:12]}...")
+                response = requests.post(AGENT_URL, data=dict(data, clip_id=clip_id, filename=video_path.name), timeout=30)
+                if response.status_code in (400, 404, 422):
+                    # The agent does not share this store (or predates it); send the bytes instead
+                    print(f"Agent could not take clip by id ({response.status_code}), uploading it")
+                    response = None
+            if response is None:
+                print(f"Uploading {video_path} to Agent...")
+                with open(video_path, 'rb') as f:
+                    files = {'file': (video_path.name, f, 'video/mp4')}
+                    # Timeout to prevent hanging
+                    response = requests.post(AGENT_URL, files=files, data=data, timeout=30)
+            if response.status_code == 202:
+                print(f"Successfully sent {event_type} event to Agent (job {response.json().get('job_id')}).")
+            else:
+                print(f"Agent did not accept {event_type} event: {response.status_code} {response.text[:200]}")
         except Exception as e:
             print(f"Failed to upload event: {e}")
 
-    def trigger_event(self, frame_buffer_snapshot, event_type: str):
+        deleted, freed = prune_directory(self.rec_dir, RECORDINGS_RETENTION_HOURS * 3600,
+                                         int(RECORDINGS_MAX_MB * 1024 * 1024), "*.mp4")
+        if deleted:
+            print(f"Pruned {deleted} old recording(s), {freed / 1e6:.1f} MB")
+
+    def trigger_event(self, frame_buffer_snapshot, event_type: str, confidence: float):
         """Save video and trigger upload."""
         timestamp = time.strftime('%Y%m%d_%H%M%S')
         filename = f"{event_type}_{timestamp}.mp4"
@@ -136,10 +171,129 @@ class VisionSystem:
         out.release()
         
         # Start upload thread
-        t = threading.Thread(target=self.upload_event_worker, args=(filepath, event_type))
+        t = threading.Thread(target=self.upload_event_worker, args=(filepath, event_type, confidence))
         t.start()
 
+    async def analyze(self, frame):
+        """Runs all detectors on a frame, triggers an event clip if needed and returns the metadata."""
+        # Run Detections in parallel
+        # Using asyncio.gather to run all detections concurrently
+        fight_detections, fire_detections, crowd_detections, weapon_detections = await asyncio.gather(
+            asyncio.to_thread(self.fight_detector.detect, frame, conf_threshold=0.75),
+            asyncio.to_thread(self.fire_detector.detect, frame, conf_threshold=0.40),
+            asyncio.to_thread(self.crowd_detector.detect, frame, conf_threshold=0.50),
+            # asyncio.to_thread(self.weapon_detector.detect, frame, conf_threshold=0.65)
+            asyncio.sleep(0, result=[]) # Return empty list for weapon detections
+        )
+        
+        # Prepare Metadata
+        metadata = {
+            "type": "detections",
+            "fight": fight_detections,
+            "fire": fire_detections,
+            "crowd": crowd_detections,
+            "weapon": weapon_detections,
+            "event_type": None # Placeholder, will be updated below
+        }
+
+        # --- Event Detection Logic ---
+        # Select the detection with the highest confidence score
+        event_type = None
+        max_confidence = 0.0
+        
+        for det in fight_detections:
+            if det["confidence"] > max_confidence:
+                max_confidence = det["confidence"]
+                event_type = "Violence"
+                
+        # Prioritize Fire
+        if fire_detections:
+            fire_conf = max(d["confidence"] for d in fire_detections)
+            max_confidence = fire_conf
+            event_type = "Fire"
+
+        # Check for Stampede
+        if not event_type and len(crowd_detections) >= STAMPEDE_THRESHOLD:
+             event_type = "Stampede"
+             if crowd_detections:
+                 max_confidence = max(d["confidence"] for d in crowd_detections)
+
+        # for det in weapon_detections:
+        #     if det["confidence"] > max_confidence:
+        #         max_confidence = det["confidence"]
+        #         event_type = "Weapon"
+
+        # Update Metadata with calculated event type
+        metadata["event_type"] = event_type
+        # ----------------------------------------
+
+        if event_type:
+            current_time = time.time()
+            if current_time - self.last_event_time > self.cooldown_seconds:
+                self.last_event_time = current_time
+                
+                # Get snapshot of buffer safely
+                with self.frame_lock:
+                    snapshot = list(self.frame_buffer)
+                    
+                # Annotate the last frame in snapshot
+                if snapshot:
+                    rec_frame = snapshot[-1].copy()
+                    cv2.putText(rec_frame, f"ALERT: {event_type}", (50, 50),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+                    snapshot[-1] = rec_frame
+                    
+                self.trigger_event(snapshot, event_type, max_confidence)
+
+        return metadata
+
+    def next_frame(self):
+        """Copy of the latest captured frame, or None if the camera has not produced one yet."""
+        with self.frame_lock:
+            if self.latest_frame is not None:
+                return self.latest_frame.copy()
+        return None
+
     async def run(self):
+        if SHM_INGEST:
+            try:
+                ring = FrameRingWriter(CAMERA_ID)
+            except Exception as e:
+                print(f"Shared memory unavailable ({e}). Falling back to websocket push.")
+            else:
+                try:
+                    await self.run_shared_memory(ring)
+                finally:
+                    ring.close()
+                if not self.is_running:
+                    return
+        await self.run_websocket()
+
+    async def run_shared_memory(self, ring):
+        """
+        Publishes raw frames and detections straight into the hub's shared-memory ring.
+        Returns if a frame or its metadata does not fit the ring, so the caller can switch
+        to the websocket push, which has no size limit.
+        """
+        print(f"Publishing {CAMERA_ID} to shared memory ring {ring.name}")
+        while self.is_running:
+            frame = self.next_frame()
+            if frame is None:
+                # No frame yet
+                await asyncio.sleep(0.1)
+                continue
+
+            metadata = await self.analyze(frame)
+            try:
+                ring.publish(frame, metadata)
+            except ValueError as e:
+                print(f"Cannot publish to shared memory ({e}). Falling back to websocket push.")
+                return
+
+            # Small sleep to yield to event loop
+            await asyncio.sleep(0.01)
+
+    async def run_websocket(self):
         print(f"Connecting to Livestream: {LIVESTREAM_URL}")
         
         async for websocket in websockets.connect(LIVESTREAM_URL):
@@ -147,62 +301,13 @@ class VisionSystem:
             try:
                 while self.is_running:
                     # Get latest frame from thread
-                    frame = None
-                    with self.frame_lock:
-                        if self.latest_frame is not None:
-                            frame = self.latest_frame.copy()
-                            
+                    frame = self.next_frame()
                     if frame is None:
                         # No frame yet
                         await asyncio.sleep(0.1)
                         continue
-                        
-                    # Run Detections in parallel
-                    # Using asyncio.gather to run all detections concurrently
-                    fight_detections, fire_detections, crowd_detections, weapon_detections = await asyncio.gather(
-                        asyncio.to_thread(self.fight_detector.detect, frame, conf_threshold=0.75),
-                        asyncio.to_thread(self.fire_detector.detect, frame, conf_threshold=0.40),
-                        asyncio.to_thread(self.crowd_detector.detect, frame, conf_threshold=0.50),
-                        # asyncio.to_thread(self.weapon_detector.detect, frame, conf_threshold=0.65)
-                        asyncio.sleep(0, result=[]) # Return empty list for weapon detections
-                    )
-                    
-                    # Prepare Metadata
-                    import json
-                    metadata = {
-                        "type": "detections",
-                        "fight": fight_detections,
-                        "fire": fire_detections,
-                        "crowd": crowd_detections,
-                        "weapon": weapon_detections,
-                        "event_type": None # Placeholder, will be updated below
-                    }
-
-                    # --- Event Detection Logic (Moved Up) ---
-                    # Select the detection with the highest confidence score
-                    event_type = None
-                    max_confidence = 0.0
-                    
-                    for det in fight_detections:
-                        if det["confidence"] > max_confidence:
-                            max_confidence = det["confidence"]
-                            event_type = "Violence"
-                            
-                    # Prioritize Fire
-                    if fire_detections:
-                        fire_conf = max(d["confidence"] for d in fire_detections)
-                        max_confidence = fire_conf
-                        event_type = "Fire"
-
-                    # Check for Stampede
-                    if not event_type and len(crowd_detections) >= STAMPEDE_THRESHOLD:
-                         event_type = "Stampede"
-                         if crowd_detections:
-                             max_confidence = max(d["confidence"] for d in crowd_detections)
 
-                    # Update Metadata with calculated event type
-                    metadata["event_type"] = event_type
-                    # ----------------------------------------
+                    metadata = await self.analyze(frame)
                     
                     # Send Metadata (Text)
                     try:
@@ -211,33 +316,6 @@ class VisionSystem:
                         print(f"WS Send JSON Error: {e}")
                         break
 
-                    
-                    # Logic was moved up. We just use the calculated values now.
-                    # if event_type: ... (logic continues below)
-
-                    # for det in weapon_detections:
-                    #     if det["confidence"] > max_confidence:
-                    #         max_confidence = det["confidence"]
-                    #         event_type = "Weapon"
-
-                    if event_type:
-                        current_time = time.time()
-                        if current_time - self.last_event_time > self.cooldown_seconds:
-                            self.last_event_time = current_time
-                            
-                            # Get snapshot of buffer safely
-                            with self.frame_lock:
-                                snapshot = list(self.frame_buffer)
-                                
-                            # Annotate the last frame in snapshot
-                            if snapshot:
-                                rec_frame = snapshot[-1].copy()
-                                cv2.putText(rec_frame, f"ALERT: {event_type}", (50, 50),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
-                                snapshot[-1] = rec_frame
-                                
-                            self.trigger_event(snapshot, event_type)
-
                     # Send Clean Frame (Binary)
                     try:
                         ret_enc, buffer = cv2.imencode('.jpg', frame)
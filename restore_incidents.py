@@ -1,59 +1,130 @@
-import os
-import requests
+import argparse
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
 from pathlib import Path
 
-# Configuration
-RECORDINGS_DIR = Path(r"c:\Users\kalgi\OneDrive\Desktop\CrowdShield-main\model\vision-model\recordings")
-SESSION_API_URL = "http://localhost:8002/upload"
-CAMERA_ID = "cam1"
-LATITUDE = "0.0"
-LONGITUDE = "0.0"
+import requests
+
+# Clips written by VisionSystem.trigger_event: <EventType>_<YYYYmmdd>_<HHMMSS>.mp4, in local time
+CLIP_NAME_RE = re.compile(r"^(?P<event_type>[A-Za-z]+)_(?P<date>\d{8})_(?P<time>\d{6})")
+DEFAULT_RECORDINGS_DIR = Path(__file__).resolve().parent / "model" / "vision-model" / "recordings"
+SEVERITY_BY_TYPE = {"Fire": "Critical", "Violence": "Critical", "Stampede": "Critical", "Weapon": "Critical"}
+
+local = threading.local()
+
+
+def http_session():
+    if not hasattr(local, "session"):
+        local.session = requests.Session()
+    return local.session
+
+
+def clip_metadata(path: Path, args) -> dict:
+    """Manifest entry for a recording, inferred from its filename."""
+    match = CLIP_NAME_RE.match(path.stem)
+    event_type = match.group("event_type") if match else "Unknown"
+    if match:
+        created = time.mktime(time.strptime(match.group("date") + match.group("time"), "%Y%m%d%H%M%S"))
+    else:
+        created = path.stat().st_mtime
+    return {
+        "description": f"Security Alert: {event_type} detected! (Restored)",
+        "notify_to": args.notify_to,
+        "camera_id": args.camera_id,
+        "event_type": event_type,
+        "latitude": args.latitude,
+        "longitude": args.longitude,
+        "severity": SEVERITY_BY_TYPE.get(event_type, "Warning"),
+        "confidence": "High (Restored)",
+        "status": args.status,
+        "created_at": created,
+    }
+
+
+def upload_batch(url: str, batch, retries: int, timeout: float) -> dict:
+    """Posts one batch to /import, retrying connection errors and 5xx with backoff."""
+    manifest = json.dumps([entry for _, entry in batch])
+    error = None
+    for attempt in range(1, retries + 1):
+        try:
+            with ExitStack() as stack:
+                files = [("files", (path.name, stack.enter_context(open(path, "rb")), "video/mp4")) for path, _ in batch]
+                response = http_session().post(url, files=files, data={"manifest": manifest}, timeout=timeout)
+            if response.status_code < 500:
+                response.raise_for_status()
+                return response.json()
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except requests.HTTPError:
+            raise
+        except requests.RequestException as e:
+            error = str(e)
+        if attempt < retries:
+            delay = 2 ** attempt
+            print(f"Batch starting {batch[0][0].name} failed ({error}), retrying in {delay}s...")
+            time.sleep(delay)
+    raise RuntimeError(error)
+
 
 def restore_incidents():
-    if not RECORDINGS_DIR.exists():
-        print(f"Recordings directory not found: {RECORDINGS_DIR}")
+    parser = argparse.ArgumentParser(description="Re-import recorded incident clips into the session service.")
+    parser.add_argument("directory", nargs="?", type=Path, default=DEFAULT_RECORDINGS_DIR,
+                        help="Directory with recorded clips (default: model/vision-model/recordings)")
+    parser.add_argument("--url", default="http://localhost:8002", help="Session service base URL")
+    parser.add_argument("--pattern", default="*.mp4", help="Glob for clips to import, e.g. 'Fire_*.mp4'")
+    parser.add_argument("--limit", type=int, help="Only the newest N clips")
+    parser.add_argument("--batch-size", type=int, default=20, help="Clips per /import request")
+    parser.add_argument("--parallel", type=int, default=4, help="Concurrent requests")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds per request")
+    parser.add_argument("--camera-id", default="cam1")
+    parser.add_argument("--latitude", default="0.0")
+    parser.add_argument("--longitude", default="0.0")
+    parser.add_argument("--notify-to", default="admin,security")
+    parser.add_argument("--status", default="pending", choices=["pending", "approved", "rejected"])
+    parser.add_argument("--dry-run", action="store_true", help="Show what would be imported")
+    args = parser.parse_args()
+
+    if not args.directory.is_dir():
+        parser.error(f"Recordings directory not found: {args.directory}")
+
+    videos = sorted(args.directory.glob(args.pattern), key=lambda p: p.stat().st_mtime, reverse=True)
+    if args.limit:
+        videos = videos[:args.limit]
+    # Oldest first, so clips of one incident land in the same or consecutive batches
+    entries = sorted(((path, clip_metadata(path, args)) for path in videos), key=lambda e: e[1]["created_at"])
+    print(f"Found {len(entries)} clip(s) in {args.directory}")
+    if args.dry_run:
+        for path, entry in entries:
+            print(f"  {path.name}: {entry['event_type']} on {entry['camera_id']} at {time.ctime(entry['created_at'])}")
         return
 
-    # Find Fire videos
-    videos = sorted(list(RECORDINGS_DIR.glob("Fire_*.mp4")), reverse=True)
-    
-    # Process only the last 5 to avoid flooding (or all if user wants, but let's stick to recent)
-    # User said "really a fire accedent", implies checking specific ones. Let's do top 5.
-    videos_to_process = videos[:5]
-    
-    print(f"Found {len(videos)} Fire videos. Restoring last {len(videos_to_process)}...")
-
-    for video_path in videos_to_process:
-        print(f"Restoring {video_path.name}...")
-        
-        # Infer severity/confidence (Mocking since we don't have the original inference result)
-        severity = "Critical"
-        confidence = "High (Restored)"
-        description = f"Security Alert: Fire detected! (Restored)"
+    url = args.url.rstrip("/") + "/import"
+    batches = [entries[i:i + args.batch_size] for i in range(0, len(entries), args.batch_size)]
+    imported = skipped = failed = 0
+    sessions = set()
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+        futures = {pool.submit(upload_batch, url, batch, args.retries, args.timeout): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += len(batch)
+                print(f"Failed to import {len(batch)} clip(s) starting {batch[0][0].name}: {e}")
+                continue
+            imported += result["imported"]
+            skipped += len(result["skipped"])
+            sessions.update(s["session_id"] for s in result["sessions"])
+            print(f"Imported {result['imported']}, skipped {len(result['skipped'])} already stored ({len(batch)} clip batch)")
+
+    print(f"Done in {time.time() - start:.1f}s: {imported} imported into {len(sessions)} session(s), "
+          f"{skipped} already stored, {failed} failed")
 
-        try:
-            with open(video_path, 'rb') as f:
-                files = {'file': (video_path.name, f, 'video/mp4')}
-                data = {
-                    'description': description,
-                    'notify_to': 'admin,security',
-                    'camera_id': CAMERA_ID,
-                    'latitude': LATITUDE,
-                    'longitude': LONGITUDE,
-                    'severity': severity,
-                    'confidence': confidence
-                }
-                
-                print(f"Sending request to {SESSION_API_URL}...")
-                response = requests.post(SESSION_API_URL, files=files, data=data)
-                
-                if response.status_code == 200:
-                    print(f"Successfully restored session for {video_path.name}")
-                else:
-                    print(f"Failed to restore session. Status: {response.status_code}, Response: {response.text}")
-                    
-        except Exception as e:
-            print(f"Error sending to Crowd Shield API: {e}")
 
 if __name__ == "__main__":
     restore_incidents()